@@ -21,9 +21,36 @@ class Extension(ext.Extension):
         schema['browse_root'] = config.String(optional=True)
         schema['browse_order'] = config.String(choices=['asc', 'desc'])
         schema['lookup_order'] = config.String(choices=['asc', 'desc'])
+        schema['lookup_limit'] = config.Integer(optional=True, minimum=1)
+        schema['lookup_max_age'] = config.Integer(optional=True, minimum=1)
+        schema['latest_episodes'] = config.Integer(minimum=0)
         schema['cache_size'] = config.Integer(minimum=1)
+        schema['cache_policy'] = config.String(
+            choices=['lru', 'arc', 'tinylfu']
+        )
         schema['cache_ttl'] = config.Integer(minimum=1)
+        schema['cache_ttl_min'] = config.Integer(minimum=1)
+        schema['cache_ttl_max'] = config.Integer(minimum=1)
+        schema['cache_warmup'] = config.Integer(minimum=0)
+        schema['shared_cache_dir'] = config.Path(optional=True)
+        schema['canonical_uris'] = config.Boolean()
+        schema['ignore_query_params'] = config.List(optional=True)
+        schema['artwork_dir'] = config.String(optional=True)
+        schema['artwork_cache_size'] = config.Integer(minimum=0)
+        schema['artwork_sizes'] = config.List(optional=True)
         schema['timeout'] = config.Integer(optional=True, minimum=1)
+        schema['episode_store'] = config.String(optional=True)
+        schema['stream_index'] = config.String(optional=True)
+        schema['profile_threshold'] = config.Integer(optional=True, minimum=0)
+        schema['profile_sample'] = config.Integer(minimum=0, maximum=100)
+        schema['profile_dir'] = config.String()
+        schema['profile_count'] = config.Integer(minimum=1)
+        schema['parse_workers'] = config.Integer(minimum=0)
+        schema['parse_threshold'] = config.Integer(minimum=0)
+        schema['xml_engine'] = config.String(
+            optional=True,
+            choices=['cElementTree', 'lxml', 'ElementTree']
+        )
         # no longer used
         schema['browse_limit'] = config.Deprecated()
         schema['search_limit'] = config.Deprecated()
@@ -37,17 +64,21 @@ class Extension(ext.Extension):
         return schema
 
     def setup(self, registry):
+        from . import artwork
         from .backend import PodcastBackend
         registry.add('backend', PodcastBackend)
+        registry.add('http:app', {
+            'name': self.ext_name,
+            'factory': artwork.factory
+        })
 
     @classmethod
-    def get_url_opener(cls, config):
+    def get_url_opener(cls, config, *handlers):
         import urllib2
         proxy = httpclient.format_proxy(config['proxy'])
         if proxy:
-            handlers = [urllib2.ProxyHandler({'http': proxy, 'https': proxy})]
-        else:
-            handlers = []
+            proxies = {'http': proxy, 'https': proxy}
+            handlers += (urllib2.ProxyHandler(proxies),)
         opener = urllib2.build_opener(*handlers)
         user_agent = '%s/%s' % (cls.dist_name, cls.version)
         opener.addheaders = [
@@ -0,0 +1,136 @@
+from __future__ import unicode_literals
+
+import argparse
+import contextlib
+import functools
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import timeit
+
+from mopidy import models
+
+import uritools
+
+from . import Extension, feeds
+
+
+def geturl(source):
+    if uritools.urisplit(source).scheme in ('file', 'http', 'https'):
+        return source
+    else:
+        return uritools.uricompose('file', '', os.path.abspath(source))
+
+
+def fetch(url, timeout=None):
+    opener = Extension.get_url_opener({'proxy': {}})
+    with contextlib.closing(opener.open(url, timeout=timeout)) as source:
+        return source.read(), source.geturl()
+
+
+def failure(url, error):
+    return {'url': url, 'error': '%s: %s' % (type(error).__name__, error)}
+
+
+def load(url, result='items', timeout=None, engine=None):
+    stats = {'url': url}
+    try:
+        engine, _ = feeds.get_engine(engine)
+        start = timeit.default_timer()
+        data, url = fetch(url, timeout)
+        fetched = timeit.default_timer()
+        feed = feeds.fromstring(data, url, engine)
+        parsed = timeit.default_timer()
+        items = list(feed.items())
+    except Exception as e:
+        return failure(url, e)
+    stats.update(
+        uri=feed.uri,
+        type=type(feed).__name__,
+        engine=engine,
+        size=len(data),
+        fetch_time=fetched - start,
+        parse_time=parsed - fetched,
+        episodes=sum(1 for ref in items if ref.type == models.Ref.TRACK)
+    )
+    if result == 'tracks':
+        stats[result] = list(feed.tracks())
+    elif result == 'images':
+        stats[result] = dict(feed.images())
+    elif result == 'items':
+        stats[result] = items
+    # convert models to plain objects for passing between processes
+    return json.loads(json.dumps(stats, cls=models.ModelJSONEncoder))
+
+
+def expand(url, timeout=None):
+    data, url = fetch(url, timeout)
+    refs = feeds.fromstring(data, url).items()
+    return [ref.uri.partition('+')[2] for ref in refs
+            if ref.type == models.Ref.ALBUM]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m mopidy_podcast',
+        description='Parse podcast feeds and report feed statistics.'
+    )
+    parser.add_argument('sources', metavar='SOURCE', nargs='+',
+                        help='feed URL or local file name')
+    parser.add_argument('-O', '--opml', action='store_true',
+                        help='process the RSS feeds listed in OPML sources')
+    parser.add_argument('-f', '--format', choices=['json', 'ndjson'],
+                        default='json', help='output format')
+    parser.add_argument('-i', '--images', action='store_const',
+                        dest='result', const='images', default='items',
+                        help='output feed images')
+    parser.add_argument('-t', '--tracks', action='store_const',
+                        dest='result', const='tracks',
+                        help='output feed tracks')
+    parser.add_argument('-s', '--stats', action='store_const',
+                        dest='result', const=None,
+                        help='output feed statistics only')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes')
+    parser.add_argument('-T', '--timeout', type=float, default=10,
+                        help='HTTP request timeout in seconds')
+    parser.add_argument('-e', '--engine', choices=list(feeds.XML_ENGINES),
+                        help='XML engine for parsing feeds')
+    args = parser.parse_args(argv)
+
+    urls = [geturl(source) for source in args.sources]
+    failed = []  # OPML sources that could not be loaded
+    if args.opml:
+        opmls, urls = urls, []
+        for opml in opmls:
+            try:
+                urls.extend(expand(opml, args.timeout))
+            except Exception as e:
+                failed.append(failure(opml, e))
+
+    pool = multiprocessing.Pool(args.jobs)
+    func = functools.partial(load, result=args.result, timeout=args.timeout,
+                             engine=args.engine)
+    errors = 0
+    try:
+        if args.format == 'ndjson':
+            for stats in itertools.chain(failed, pool.imap(func, urls)):
+                errors += 'error' in stats
+                json.dump(stats, sys.stdout, sort_keys=True)
+                sys.stdout.write('\n')
+                sys.stdout.flush()
+        else:
+            result = failed + pool.map(func, urls)
+            errors += sum('error' in stats for stats in result)
+            json.dump(result, sys.stdout, indent=2, sort_keys=True)
+            sys.stdout.write('\n')
+    finally:
+        pool.close()
+        pool.join()
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main())
@@ -0,0 +1,253 @@
+from __future__ import unicode_literals
+
+import Queue
+import collections
+import hashlib
+import io
+import json
+import logging
+import os
+import posixpath
+import threading
+import urlparse
+
+from mopidy import models
+
+from . import Extension, util
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {
+    'image/gif': '.gif',
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/webp': '.webp'
+}
+
+EXTENSIONS = frozenset(CONTENT_TYPES.values()) | {'.jpeg'}
+
+URI_PREFIX = '/%s/artwork/' % Extension.ext_name
+
+
+def get_artwork_dir(config):
+    path = config[Extension.ext_name]['artwork_dir']
+    if not path:
+        return None
+    if not os.path.isabs(path):
+        data_dir = util.get_data_dir(config)
+        if not data_dir:
+            return None
+        path = os.path.join(data_dir, path)
+    return path
+
+
+def factory(config, core):
+    from tornado.web import StaticFileHandler
+    path = get_artwork_dir(config)
+    if path:
+        return [(r'/artwork/(.*)', StaticFileHandler, {'path': path})]
+    else:
+        return []
+
+
+class ArtworkCache(object):
+
+    def __init__(self, path, maxsize, sizes=(), opener=None, timeout=None):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.__path = path
+        self.__maxsize = maxsize
+        self.__sizes = sorted(set(sizes))
+        self.__opener = opener or Extension.get_url_opener({'proxy': {}})
+        self.__timeout = timeout
+        self.__lock = threading.Lock()
+        self.__entries = collections.OrderedDict()  # in LRU order
+        self.__currsize = 0
+        self.__pending = set()
+        self.__failed = set()
+        self.__queue = Queue.Queue()
+        self.__thread = None
+        self.__load()
+
+    def images(self, images):
+        result = []
+        for image in images:
+            with self.__lock:
+                entry = self.__entries.get(image.uri)
+                if entry is not None:
+                    self.__touch(image.uri, entry)
+            if entry is not None:
+                result.extend(entry['images'])
+            else:
+                self.__fetch_async(image.uri)
+                result.append(image)
+        return result
+
+    def close(self):
+        if self.__thread is not None:
+            self.__queue.put(None)
+            self.__thread.join()
+            self.__thread = None
+
+    def join(self):
+        self.__queue.join()
+
+    def __load(self):
+        entries = []
+        for name in os.listdir(self.__path):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.__path, name)
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+                entry = self.__entry(data['url'], data['images'])
+                entries.append((os.path.getmtime(path), entry))
+            except Exception as e:
+                logger.warning('Removing invalid artwork %s: %s', path, e)
+                digest = name[:-len('.json')]
+                self.__remove([n for n in os.listdir(self.__path)
+                               if n.startswith(digest)])
+        for _, entry in sorted(entries):
+            self.__entries[entry['url']] = entry
+            self.__currsize += entry['size']
+        self.__evict()
+
+    def __entry(self, url, images):
+        size = 0
+        for name, _, _ in images:
+            size += os.path.getsize(os.path.join(self.__path, name))
+        return {
+            'url': url,
+            'images': [
+                models.Image(uri=URI_PREFIX + name, width=w, height=h)
+                for name, w, h in images
+            ],
+            'names': [name for name, _, _ in images],
+            'size': size
+        }
+
+    def __touch(self, url, entry):
+        self.__entries[url] = self.__entries.pop(url)
+        try:
+            os.utime(os.path.join(self.__path, self.__digest(url) + '.json'),
+                     None)
+        except EnvironmentError as e:
+            logger.debug('Error updating artwork %s: %s', url, e)
+
+    def __evict(self):
+        while self.__currsize > self.__maxsize and self.__entries:
+            url, entry = self.__entries.popitem(last=False)
+            self.__currsize -= entry['size']
+            # remove metadata first, so partial entries are not loaded
+            self.__remove([self.__digest(url) + '.json'] + entry['names'])
+
+    def __remove(self, names):
+        for name in names:
+            try:
+                os.remove(os.path.join(self.__path, name))
+            except EnvironmentError as e:
+                logger.warning('Error removing artwork %s: %s',
+                               name, util.strerror(e))
+
+    def __fetch_async(self, url):
+        with self.__lock:
+            if url in self.__pending or url in self.__failed:
+                return
+            self.__pending.add(url)
+            if self.__thread is None:
+                self.__thread = threading.Thread(
+                    target=self.__worker,
+                    name='PodcastArtwork'
+                )
+                self.__thread.daemon = True
+                self.__thread.start()
+        self.__queue.put(url)
+
+    def __worker(self):
+        while True:
+            url = self.__queue.get()
+            try:
+                if url is None:
+                    break
+                self.__fetch(url)
+            except Exception as e:
+                logger.warning('Error caching artwork %s: %s', url, e)
+                with self.__lock:
+                    self.__failed.add(url)
+            finally:
+                with self.__lock:
+                    self.__pending.discard(url)
+                self.__queue.task_done()
+
+    def __fetch(self, url):
+        response = self.__opener.open(url, timeout=self.__timeout)
+        try:
+            ext = self.__extension(url, response.info().gettype())
+            data = response.read(self.__maxsize + 1)
+        finally:
+            response.close()
+        if len(data) > self.__maxsize:
+            raise ValueError('Image exceeds artwork cache size')
+        digest = self.__digest(url)
+        try:
+            original = (digest + ext,) + self.__save(digest + ext, data)
+            # smaller variants first, for clients picking the first image
+            images = self.__resize(digest, data, original[1:]) + [original]
+            with open(os.path.join(self.__path, digest + '.json'), 'w') as f:
+                json.dump({'url': url, 'images': images}, f)
+            entry = self.__entry(url, images)
+        except Exception:
+            self.__remove([n for n in os.listdir(self.__path)
+                           if n.startswith(digest)])
+            raise
+        with self.__lock:
+            self.__entries[url] = entry
+            self.__currsize += entry['size']
+            self.__evict()
+        logger.debug('Cached artwork %s as %s', url, digest)
+
+    def __save(self, name, data):
+        with open(os.path.join(self.__path, name), 'wb') as f:
+            f.write(data)
+        try:
+            from PIL import Image
+        except ImportError:
+            return (None, None)
+        try:
+            return Image.open(io.BytesIO(data)).size
+        except Exception as e:
+            logger.debug('Cannot determine size of artwork %s: %s', name, e)
+            return (None, None)
+
+    def __resize(self, digest, data, size):
+        width, height = size
+        if not width or not height or not self.__sizes:
+            return []
+        from PIL import Image  # import checked by __save()
+        result = []
+        for size in self.__sizes:
+            if size >= max(width, height):
+                break
+            image = Image.open(io.BytesIO(data))
+            image.thumbnail((size, size), Image.ANTIALIAS)
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            name = '%s-%d.jpg' % (digest, size)
+            image.save(os.path.join(self.__path, name), 'JPEG')
+            result.append((name,) + image.size)
+        return result
+
+    @classmethod
+    def __digest(cls, url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def __extension(cls, url, content_type):
+        if content_type in CONTENT_TYPES:
+            return CONTENT_TYPES[content_type]
+        path = urlparse.urlsplit(url).path
+        ext = posixpath.splitext(path)[1].lower()
+        if ext in EXTENSIONS:
+            return ext
+        raise ValueError('Unsupported content type %s' % content_type)
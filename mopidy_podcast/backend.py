@@ -1,42 +1,502 @@
 from __future__ import unicode_literals
 
+import Queue
+import collections
 import contextlib
+import email.utils
+import fnmatch
+import json
 import logging
-
-import cachetools
+import multiprocessing
+import os
+import re
+import signal
+import threading
+import time
+import urllib2
+import urlparse
 
 from mopidy import backend
 
 import pykka
 
-from . import Extension, feeds
+from . import Extension, artwork, episodes, profiling, stores, util
 from .library import PodcastLibraryProvider
 from .playback import PodcastPlaybackProvider
 
 logger = logging.getLogger(__name__)
 
+RECENT_FEEDS_FILE = 'recent.json'
 
-class PodcastFeedCache(cachetools.TTLCache):
+MAX_AGE_RE = re.compile(r'\bmax-age\s*=\s*"?(\d+)', flags=re.IGNORECASE)
 
-    pykka_traversable = True
+DEFAULT_PORTS = {'podcast+http': 80, 'podcast+https': 443}
+
+
+def get_episode_store(config):
+    path = config[Extension.ext_name]['episode_store']
+    if not path:
+        return None
+    if not os.path.isabs(path):
+        data_dir = util.get_data_dir(config)
+        if not data_dir:
+            return None
+        path = os.path.join(data_dir, path)
+    try:
+        return episodes.EpisodeStore(path)
+    except Exception as e:
+        logger.warning('Cannot open %s episode store %s: %s',
+                       Extension.dist_name, path, e)
+        return None
+
+
+def get_stream_index(config):
+    path = config[Extension.ext_name]['stream_index']
+    if not path:
+        return None
+    if not os.path.isabs(path):
+        data_dir = util.get_data_dir(config)
+        if not data_dir:
+            return None
+        path = os.path.join(data_dir, path)
+    try:
+        return episodes.StreamIndex(path)
+    except Exception as e:
+        logger.warning('Cannot open %s stream index %s: %s',
+                       Extension.dist_name, path, e)
+        return None
+
+
+def get_profiler(config):
+    ext_config = config[Extension.ext_name]
+    if ext_config['profile_threshold'] is None:
+        return None
+    path = ext_config['profile_dir']
+    if not os.path.isabs(path):
+        data_dir = util.get_data_dir(config)
+        if not data_dir:
+            return None
+        path = os.path.join(data_dir, path)
+    try:
+        return profiling.Profiler(
+            path,
+            threshold=ext_config['profile_threshold'],
+            sample=ext_config['profile_sample'],
+            count=ext_config['profile_count']
+        )
+    except Exception as e:
+        logger.warning('Cannot create %s profile directory %s: %s',
+                       Extension.dist_name, path, e)
+        return None
+
+
+def get_artwork_cache(config):
+    path = artwork.get_artwork_dir(config)
+    if not path:
+        return None
+    ext_config = config[Extension.ext_name]
+    try:
+        sizes = [int(size) for size in ext_config['artwork_sizes'] or []]
+    except ValueError as e:
+        logger.warning('Invalid %s artwork sizes: %s', Extension.dist_name, e)
+        sizes = []
+    try:
+        return artwork.ArtworkCache(
+            path,
+            maxsize=ext_config['artwork_cache_size'],
+            sizes=sizes,
+            opener=Extension.get_url_opener(config),
+            timeout=ext_config['timeout']
+        )
+    except Exception as e:
+        logger.warning('Cannot create %s artwork directory %s: %s',
+                       Extension.dist_name, path, e)
+        return None
+
+
+def get_max_age(headers, now):
+    match = MAX_AGE_RE.search(headers.get('Cache-Control') or '')
+    if match:
+        return int(match.group(1))
+    try:
+        expires = email.utils.mktime_tz(
+            email.utils.parsedate_tz(headers.get('Expires'))
+        )
+    except TypeError:
+        return None
+    try:
+        date = email.utils.mktime_tz(
+            email.utils.parsedate_tz(headers.get('Date'))
+        )
+    except TypeError:
+        date = now
+    return max(expires - date, 0)
 
-    def __init__(self, config):
-        # FIXME: "missing" parameter will be deprecated in cachetools v1.2
-        super(PodcastFeedCache, self).__init__(
-            maxsize=config[Extension.ext_name]['cache_size'],
-            ttl=config[Extension.ext_name]['cache_ttl'],
-            missing=self.__missing
+
+def canonicalize(uri, ignore_query_params=()):
+    import uritools
+    parts = uritools.urisplit(uri)
+    scheme = parts.getscheme()
+    if scheme not in DEFAULT_PORTS:
+        return uritools.uridefrag(uri).uri
+    port = parts.getport()
+    if port == DEFAULT_PORTS[scheme]:
+        port = None
+    query = sorted(
+        (name, value) for name, value in parts.getquerylist()
+        if not any(fnmatch.fnmatchcase(name, pattern)
+                   for pattern in ignore_query_params)
+    )
+    # treat HTTP and HTTPS URIs as aliases
+    return uritools.uricompose(
+        scheme='podcast+http',
+        userinfo=parts.getuserinfo(),
+        host=parts.gethost(),
+        port=port,
+        path=parts.getpath().rstrip('/') or '/',
+        query=query or None
+    )
+
+
+class RedirectHandler(urllib2.HTTPRedirectHandler):
+
+    def http_error_302(self, req, fp, code, msg, headers):
+        newurl = urlparse.urljoin(
+            req.get_full_url(),
+            headers.get('location') or headers.get('uri')
         )
-        self.__opener = Extension.get_url_opener(config)
-        self.__timeout = config[Extension.ext_name]['timeout']
+        response = urllib2.HTTPRedirectHandler.http_error_302(
+            self, req, fp, code, msg, headers
+        )
+        # record redirects, so permanently moved feeds can be aliased
+        redirects = getattr(response, 'redirects', [])
+        response.redirects = [(code, newurl)] + redirects
+        return response
+
+    http_error_301 = http_error_303 = http_error_307 = http_error_302
+
+
+def get_permanent_url(url, redirects):
+    for code, newurl in redirects:
+        if code != 301:
+            break
+        url = newurl
+    return url
+
+
+class PodcastFeedCache(object):
+
+    pykka_traversable = True
+
+    # number of worker threads for background refreshes
+    REFRESH_THREADS = 4
+
+    # maximum time in seconds for parsing a feed in a worker process
+    PARSE_TIMEOUT = 60
+
+    def __init__(self, config, timer=time.time, episode_store=None,
+                 stream_index=None):
+        ext_config = config[Extension.ext_name]
+        self.__timer = timer
+        self.__episodes = episode_store
+        self.__streams = stream_index
+        self.__ttl = ext_config['cache_ttl']
+        self.__ttl_min = ext_config['cache_ttl_min']
+        self.__ttl_max = ext_config['cache_ttl_max']
+        self.__stores = [stores.MemoryStore(
+            ext_config['cache_size'],
+            policy=ext_config['cache_policy']
+        )]
+        if ext_config['shared_cache_dir']:
+            self.__stores.append(stores.FileStore(
+                ext_config['shared_cache_dir'],
+                maxage=max(self.__ttl, self.__ttl_max),
+                timer=timer
+            ))
+        self.__expired = set()  # feeds marked for refreshing locally
+        self.__opener = Extension.get_url_opener(config, RedirectHandler())
+        self.__canonical_uris = ext_config['canonical_uris']
+        self.__ignore_query_params = ext_config['ignore_query_params'] or ()
+        self.__aliases = {}  # permanently moved feeds
+        self.__timeout = ext_config['timeout']
+        self.__parse_workers = ext_config['parse_workers']
+        self.__parse_threshold = ext_config['parse_threshold']
+        self.__xml_engine = ext_config['xml_engine']
+        self.__lock = threading.Lock()
+        # fork worker processes early, before more threads are started
+        self.__pool = self.__create_pool() if self.__parse_workers else None
+        self.__recent = collections.OrderedDict()
+        self.__maxrecent = ext_config['cache_size']
+        self.__refreshing = set()
+        self.__refresh_queue = Queue.Queue()
+        self.__refresh_threads = []
+        self.__closed = False
+
+    def __contains__(self, uri):
+        return self.__lookup(self.__key(uri), promote=False) is not None
 
-    def __missing(self, uri):
+    def __delitem__(self, uri):
+        if self.pop(uri, None) is None:
+            raise KeyError(uri)
+
+    def __getitem__(self, uri):
+        key = self.__key(uri)
+        entry = self.__lookup(key)
+        if entry is None:
+            # the outermost store coordinates refreshing, so only one
+            # thread or process will retrieve a given feed at a time
+            with self.__stores[-1].lock(key):
+                entry = self.__lookup(key)
+                if entry is None:
+                    entry = self.__refresh(key, uri)
+        elif self.__isstale(key, entry):
+            # keep serving stale feed while refreshing in the background
+            self.__refresh_async(key, uri)
+        with self.__lock:
+            self.__recent.pop(uri, None)
+            self.__recent[uri] = True
+            if len(self.__recent) > self.__maxrecent:
+                self.__recent.popitem(last=False)
+        return entry.feed
+
+    def __iter__(self):
+        return (uri for uri in self.__stores[0].keys() if uri in self)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def clear(self):
+        for store in self.__stores:
+            store.clear()
+        with self.__lock:
+            self.__expired.clear()
+
+    def close(self):
+        with self.__lock:
+            self.__closed = True
+            threads = self.__refresh_threads
+            self.__refresh_threads = []
+        # pending refreshes are discarded when closed
+        for thread in threads:
+            self.__refresh_queue.put(None)
+        for thread in threads:
+            thread.join()
+        with self.__lock:
+            if self.__pool is not None:
+                self.__pool.terminate()
+                self.__pool.join()
+            self.__pool = None
+        for store in self.__stores:
+            store.close()
+
+    def expire(self, uri=None):
+        # only mark feeds used by this instance, without touching entries
+        # in shared stores, which may have been refreshed by others
+        keys = self.__stores[0].keys() if uri is None else [self.__key(uri)]
+        with self.__lock:
+            self.__expired.update(keys)
+
+    def join(self):
+        # wait for pending background refreshes
+        self.__refresh_queue.join()
+
+    def peek(self, uri):
+        # return cached entry without retrieving missing feeds
+        key = self.__key(uri)
+        entry = self.__lookup(key, promote=False)
+        if entry is not None and self.__isstale(key, entry):
+            self.__refresh_async(key, uri)
+        return entry
+
+    def stats(self):
+        return self.__stores[0].stats()
+
+    def recent(self):
+        with self.__lock:
+            return list(reversed(self.__recent))
+
+    def pop(self, uri, *default):
+        key = self.__key(uri)
+        entry = self.__lookup(key, promote=False)
+        for store in self.__stores:
+            store.delete(key)
+        with self.__lock:
+            self.__expired.discard(key)
+        if entry is not None:
+            return entry.feed
+        elif default:
+            return default[0]
+        else:
+            raise KeyError(uri)
+
+    def __key(self, uri):
+        if self.__canonical_uris:
+            key = canonicalize(uri, self.__ignore_query_params)
+        else:
+            key = uri
+        with self.__lock:
+            return self.__aliases.get(key, key)
+
+    def __load(self, uri):
+        from . import feeds
         ext_name, _, feedurl = uri.partition('+')
         assert ext_name == Extension.ext_name
         f = self.__opener.open(feedurl, timeout=self.__timeout)
         with contextlib.closing(f) as source:
-            feed = feeds.parse(source)
-        return feed
+            if self.__parse_workers:
+                feed = self.__parse(source.read(), source.geturl())
+            else:
+                feed = feeds.parse(source, engine=self.__xml_engine)
+            headers = source.info()
+            redirects = getattr(source, 'redirects', [])
+        now = self.__timer()
+        ttl = get_max_age(headers, now)
+        if ttl is None:
+            ttl = feed.ttl(now)
+        if ttl is None:
+            ttl = self.__ttl
+        else:
+            ttl = min(max(ttl, self.__ttl_min), self.__ttl_max)
+        logger.debug('Caching %s for %d seconds', uri, ttl)
+        url = get_permanent_url(feedurl, redirects)
+        return stores.FeedEntry(feed, now + ttl), ext_name + '+' + url
+
+    def __update_episodes(self, entry):
+        try:
+            self.__episodes.update(entry.feed, entry.expires)
+        except Exception as e:
+            logger.warning('Error storing episodes of %s: %s',
+                           entry.feed.uri, e)
+
+    def __update_streams(self, entry):
+        try:
+            self.__streams.update(entry.feed)
+        except Exception as e:
+            logger.warning('Error indexing streams of %s: %s',
+                           entry.feed.uri, e)
+
+    def __isstale(self, uri, entry):
+        return uri in self.__expired or not self.__timer() < entry.expires
+
+    def __lookup(self, uri, promote=True):
+        now = self.__timer()
+        stale = None
+        expired = uri in self.__expired
+        for index, store in enumerate(self.__stores):
+            entry = store.get(uri)
+            if entry is not None and not expired and now < entry.expires:
+                if promote:
+                    for inner in self.__stores[:index]:
+                        inner.set(uri, entry)
+                return entry
+            elif stale is None:
+                stale = entry
+        return stale
+
+    def __refresh(self, key, uri):
+        from . import feeds
+        entry, location = self.__load(uri)
+        if location != uri:
+            key = self.__move(key, location)
+        for store in self.__stores:
+            store.set(key, entry)
+        with self.__lock:
+            self.__expired.discard(key)
+        # directories are small, and have no episodes to store
+        if isinstance(entry.feed, feeds.RssFeed):
+            if self.__episodes is not None:
+                self.__update_episodes(entry)
+            if self.__streams is not None:
+                self.__update_streams(entry)
+        return entry
+
+    def __move(self, key, location):
+        newkey = self.__key(location)
+        if newkey != key:
+            logger.info('Podcast feed %s moved permanently to %s',
+                        key, location)
+            with self.__lock:
+                for alias, target in self.__aliases.items():
+                    if target == key:
+                        self.__aliases[alias] = newkey
+                self.__aliases[key] = newkey
+                self.__expired.discard(key)
+            for store in self.__stores:
+                store.delete(key)
+        return newkey
+
+    def __refresh_async(self, key, uri):
+        with self.__lock:
+            if self.__closed or key in self.__refreshing:
+                return
+            self.__refreshing.add(key)
+            while len(self.__refresh_threads) < self.REFRESH_THREADS:
+                thread = threading.Thread(target=self.__refresh_worker,
+                                          name='PodcastFeedRefresh')
+                thread.daemon = True
+                thread.start()
+                self.__refresh_threads.append(thread)
+        self.__refresh_queue.put((key, uri))
+
+    def __refresh_worker(self):
+        while True:
+            item = self.__refresh_queue.get()
+            try:
+                if item is None:
+                    return
+                elif not self.__closed:
+                    self.__refresh_stale(*item)
+            finally:
+                self.__refresh_queue.task_done()
+
+    def __refresh_stale(self, key, uri):
+        try:
+            with self.__stores[-1].lock(key):
+                entry = self.__lookup(key)
+                if entry is None or self.__isstale(key, entry):
+                    self.__refresh(key, uri)
+        except Exception as e:
+            logger.warning('Error refreshing %s: %s', uri, e)
+            # keep serving the stale feed locally, and retry later
+            entry = self.__stores[0].get(key)
+            if entry is not None:
+                expires = self.__timer() + self.__ttl_min
+                self.__stores[0].set(key, entry._replace(expires=expires))
+            with self.__lock:
+                self.__expired.discard(key)
+        finally:
+            with self.__lock:
+                self.__refreshing.discard(key)
+
+    def __create_pool(self):
+        # worker processes should leave SIGINT handling to Mopidy
+        return multiprocessing.Pool(
+            processes=self.__parse_workers,
+            initializer=signal.signal,
+            initargs=(signal.SIGINT, signal.SIG_IGN)
+        )
+
+    def __parse(self, data, url):
+        from . import feeds
+        engine = self.__xml_engine
+        if len(data) < self.__parse_threshold:
+            return feeds.fromstring(data, url, engine)
+        with self.__lock:
+            if self.__pool is None:
+                self.__pool = self.__create_pool()
+            pool = self.__pool
+        logger.debug('Parsing %s in worker process', url)
+        result = pool.apply_async(feeds.fromstring, (data, url, engine))
+        try:
+            return result.get(self.PARSE_TIMEOUT)
+        except multiprocessing.TimeoutError:
+            # worker may have died, so Pool.apply() would never return
+            logger.warning('Timeout parsing %s in worker process', url)
+        with self.__lock:
+            if self.__pool is pool:
+                self.__pool = None
+        pool.terminate()
+        return feeds.fromstring(data, url, engine)
 
 
 class PodcastBackend(pykka.ThreadingActor, backend.Backend):
@@ -50,6 +510,99 @@ class PodcastBackend(pykka.ThreadingActor, backend.Backend):
 
     def __init__(self, config, audio):
         super(PodcastBackend, self).__init__()
-        self.feeds = PodcastFeedCache(config)
+        self.episodes = get_episode_store(config)
+        self.streams = get_stream_index(config)
+        self.profiler = get_profiler(config)
+        self.artwork = get_artwork_cache(config)
+        self.feeds = PodcastFeedCache(
+            config,
+            episode_store=self.episodes,
+            stream_index=self.streams
+        )
         self.library = PodcastLibraryProvider(config, backend=self)
         self.playback = PodcastPlaybackProvider(audio, backend=self)
+        self.__cache_warmup = config[Extension.ext_name]['cache_warmup']
+        if self.__cache_warmup:
+            self.__data_dir = util.get_data_dir(config)
+        else:
+            self.__data_dir = None
+        self.__warm_up_thread = None
+        self.__stopping = threading.Event()
+
+    def on_start(self):
+        if self.__cache_warmup:
+            # warm up cache in the background to not delay startup
+            self.__warm_up_thread = threading.Thread(
+                target=self.warm_up,
+                name='PodcastCacheWarmUp'
+            )
+            self.__warm_up_thread.daemon = True
+            self.__warm_up_thread.start()
+
+    def on_stop(self):
+        # stores must not be closed while still warming up
+        self.__stopping.set()
+        if self.__warm_up_thread is not None:
+            self.__warm_up_thread.join()
+        if self.__cache_warmup and self.__data_dir:
+            self.__save_recent(self.__data_dir)
+        stats = self.feeds.stats()
+        lookups = stats['hits'] + stats['misses']
+        if lookups:
+            logger.info(
+                'Podcast feed cache (%s): %d hits, %d misses, '
+                '%.1f%% hit ratio',
+                stats['policy'], stats['hits'], stats['misses'],
+                100.0 * stats['hits'] / lookups
+            )
+        self.feeds.close()
+        if self.artwork is not None:
+            self.artwork.close()
+        if self.streams is not None:
+            self.streams.close()
+        if self.episodes is not None:
+            self.episodes.close()
+
+    def warm_up(self):
+        start = time.time()
+        uris = self.__load_recent(self.__data_dir)[:self.__cache_warmup]
+        root = self.library.root_directory
+        if root and root.uri not in uris:
+            uris.insert(0, root.uri)
+        count = 0
+        for uri in uris:
+            if self.__stopping.is_set():
+                break
+            try:
+                self.feeds[uri]
+            except Exception as e:
+                logger.debug('Error preloading %s: %s', uri, e)
+            else:
+                count += 1
+        logger.info('Preloaded %d podcast feeds in %.1f seconds',
+                    count, time.time() - start)
+
+    def __load_recent(self, path):
+        if not path:
+            return []
+        try:
+            with open(os.path.join(path, RECENT_FEEDS_FILE)) as f:
+                uris = json.load(f)
+            if not isinstance(uris, list) or not all(
+                isinstance(uri, basestring) for uri in uris
+            ):
+                raise ValueError('Invalid list of feed URIs')
+        except IOError:
+            return []
+        except Exception as e:
+            logger.warning('Error loading recently used podcast feeds: %s', e)
+            return []
+        else:
+            return uris
+
+    def __save_recent(self, path):
+        try:
+            with open(os.path.join(path, RECENT_FEEDS_FILE), 'w') as f:
+                json.dump(self.feeds.recent(), f)
+        except Exception as e:
+            logger.warning('Error saving recently used podcast feeds: %s', e)
@@ -0,0 +1,199 @@
+from __future__ import unicode_literals
+
+import datetime
+import json
+import logging
+import sqlite3
+import threading
+
+from mopidy import models
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS feed (
+    uri         TEXT PRIMARY KEY,
+    expires     REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS episode (
+    uri         TEXT PRIMARY KEY,
+    feed        TEXT NOT NULL REFERENCES feed (uri) ON DELETE CASCADE,
+    guid        TEXT NOT NULL,
+    name        TEXT,
+    author      TEXT,
+    date        TEXT,
+    track_no    INTEGER,
+    stream      TEXT,
+    track       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS episode_feed_index ON episode (feed, track_no);
+CREATE INDEX IF NOT EXISTS episode_guid_index ON episode (guid);
+CREATE INDEX IF NOT EXISTS episode_date_index ON episode (date);
+CREATE INDEX IF NOT EXISTS episode_author_index ON episode (author);
+"""
+
+STREAM_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stream (
+    uri         TEXT PRIMARY KEY,
+    feed        TEXT NOT NULL,
+    url         TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stream_feed_index ON stream (feed);
+"""
+
+
+def encode(track):
+    return json.dumps(track, cls=models.ModelJSONEncoder)
+
+
+def decode(data):
+    return json.loads(data, object_hook=models.model_json_decoder)
+
+
+class EpisodeStore(object):
+
+    def __init__(self, path):
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        self.__connection.execute('PRAGMA foreign_keys = ON')
+        self.__connection.executescript(SCHEMA)
+        self.__lock = threading.Lock()
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    def update(self, feed, expires):
+        import uritools
+        streams = dict(feed.streams())
+        rows = [(
+            track.uri,
+            feed.uri,
+            uritools.uridefrag(track.uri).getfragment(),
+            track.name,
+            ', '.join(sorted(a.name for a in track.artists)) or None,
+            track.date,
+            track.track_no,
+            streams.get(track.uri),
+            encode(track)
+        ) for track in feed.tracks()]
+        with self.__lock, self.__connection as c:
+            c.execute('DELETE FROM feed WHERE uri = ?', (feed.uri,))
+            c.execute('INSERT INTO feed VALUES (?, ?)', (feed.uri, expires))
+            c.executemany(
+                'INSERT OR REPLACE INTO episode VALUES (?,?,?,?,?,?,?,?,?)',
+                rows
+            )
+
+    def expire(self, uri=None):
+        with self.__lock, self.__connection as c:
+            if uri is None:
+                c.execute('UPDATE feed SET expires = 0')
+            else:
+                c.execute('UPDATE feed SET expires = 0 WHERE uri = ?', (uri,))
+
+    def items(self, uri, newest_first=False, now=None):
+        rows = self.__episodes('uri, name', uri, newest_first, now)
+        if rows is not None:
+            return [models.Ref.track(uri=u, name=name) for u, name in rows]
+        else:
+            return None
+
+    def tracks(self, uri, newest_first=False, now=None, limit=None,
+               since=None):
+        rows = self.__episodes('track', uri, newest_first, now, limit, since)
+        if rows is not None:
+            return [decode(track) for track, in rows]
+        else:
+            return None
+
+    def track(self, uri, now=None):
+        with self.__lock:
+            row = self.__connection.execute(
+                'SELECT track, expires FROM episode'
+                ' JOIN feed ON episode.feed = feed.uri'
+                ' WHERE episode.uri = ?', (uri,)
+            ).fetchone()
+        if row is None or (now is not None and row[1] <= now):
+            return None
+        else:
+            return decode(row[0])
+
+    def streamuri(self, uri):
+        with self.__lock:
+            row = self.__connection.execute(
+                'SELECT stream FROM episode WHERE uri = ?', (uri,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def query(self, feed=None, guid=None, author=None, since=None,
+              until=None, limit=None):
+        terms = []
+        params = []
+        for column, op, value in [
+            ('feed', '=', feed),
+            ('guid', '=', guid),
+            ('author', '=', author),
+            ('date', '>=', since),
+            ('date', '<=', until)
+        ]:
+            if value is not None:
+                terms.append('%s %s ?' % (column, op))
+                params.append(value)
+        sql = 'SELECT track FROM episode'
+        if terms:
+            sql += ' WHERE ' + ' AND '.join(terms)
+        sql += ' ORDER BY date DESC, track_no DESC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        with self.__lock:
+            rows = self.__connection.execute(sql, params).fetchall()
+        return [decode(track) for track, in rows]
+
+    def __episodes(self, columns, uri, newest_first, now, limit=None,
+                   since=None):
+        sql = 'SELECT %s, track_no FROM episode WHERE feed = ?' % columns
+        params = [uri]
+        if since is not None:
+            sql += ' AND date >= ?'
+            params.append(datetime.datetime.utcfromtimestamp(
+                since
+            ).date().isoformat())
+        if limit is not None:
+            # select newest episodes first, then sort as requested
+            sql = 'SELECT * FROM (%s ORDER BY track_no DESC LIMIT ?)' % sql
+            params.append(limit)
+        sql += ' ORDER BY track_no %s' % ('DESC' if newest_first else 'ASC')
+        with self.__lock:
+            row = self.__connection.execute(
+                'SELECT expires FROM feed WHERE uri = ?', (uri,)
+            ).fetchone()
+            if row is None or (now is not None and row[0] <= now):
+                return None
+            rows = self.__connection.execute(sql, params).fetchall()
+        return [r[:-1] for r in rows]
+
+
+class StreamIndex(object):
+
+    def __init__(self, path):
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        self.__connection.executescript(STREAM_SCHEMA)
+        self.__lock = threading.Lock()
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    def update(self, feed):
+        rows = [(uri, feed.uri, url) for uri, url in feed.streams()]
+        with self.__lock, self.__connection as c:
+            c.execute('DELETE FROM stream WHERE feed = ?', (feed.uri,))
+            c.executemany('INSERT OR REPLACE INTO stream VALUES (?,?,?)', rows)
+
+    def streamuri(self, uri):
+        with self.__lock:
+            row = self.__connection.execute(
+                'SELECT url FROM stream WHERE uri = ?', (uri,)
+            ).fetchone()
+        return row[0] if row else None
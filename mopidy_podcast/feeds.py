@@ -1,8 +1,13 @@
 from __future__ import unicode_literals
 
+import collections
 import datetime
 import email.utils
+import importlib
+import io
+import itertools
 import re
+import time
 
 from mopidy import models
 
@@ -10,18 +15,56 @@ import uritools
 
 from . import Extension
 
-try:
-    import xml.etree.cElementTree as ElementTree
-except ImportError:
-    import xml.etree.ElementTree as ElementTree
+# XML engines in order of preference, imported on first use; lxml
+# parses faster, but is slower to access from Python, so cElementTree
+# still performs slightly better for typical feeds
+XML_ENGINES = collections.OrderedDict([
+    ('cElementTree', 'xml.etree.cElementTree'),
+    ('lxml', 'lxml.etree'),
+    ('ElementTree', 'xml.etree.ElementTree')
+])
 
 
-def parse(source):
-    if isinstance(source, basestring):
+# compact, picklable representations of RSS channel and item elements
+RssChannel = collections.namedtuple('RssChannel', [
+    'title', 'author', 'category', 'image', 'ttl', 'update_period',
+    'update_frequency'
+])
+
+RssItem = collections.namedtuple('RssItem', [
+    'guid', 'title', 'url', 'author', 'image', 'duration', 'pubdate',
+    'description'
+])
+
+
+def get_engine(name=None):
+    if name is not None and name not in XML_ENGINES:
+        raise ValueError('Unknown XML engine: %s' % name)
+    for engine in ([name] if name else XML_ENGINES):
+        try:
+            return engine, importlib.import_module(XML_ENGINES[engine])
+        except ImportError:
+            if name:
+                raise
+    raise ImportError('No XML engine available')
+
+
+def fromstring(data, url, engine=None):
+    return parse(io.BytesIO(data), url, engine)
+
+
+def parse(source, url=None, engine=None):
+    if url is None and isinstance(source, basestring):
         url = uritools.uricompose('file', '', source)
-    else:
+    elif url is None:
         url = source.geturl()
-    root = ElementTree.parse(source).getroot()
+    name, etree = get_engine(engine)
+    if name == 'lxml':
+        # like ElementTree, never retrieve external entities or DTDs
+        parser = etree.XMLParser(resolve_entities=False, no_network=True)
+    else:
+        parser = None
+    root = etree.parse(source, parser).getroot()
     if root.tag == 'rss':
         return RssFeed(url, root)
     elif root.tag == 'opml':
@@ -45,20 +88,42 @@ class PodcastFeed(object):
     def getstreamuri(self, guid):
         raise NotImplemented
 
+    def ttl(self, now=None):
+        return None
+
     def items(self, newest_first=None):
         raise NotImplemented
 
-    def tracks(self, newest_first=None):
+    def tracks(self, newest_first=None, limit=None, since=None):
         return []
 
     def images(self):
         return []
 
+    def latest(self, count):
+        return []
+
+    def streams(self):
+        return []
+
 
 class RssFeed(PodcastFeed):
 
     ITUNES_PREFIX = '{http://www.itunes.com/dtds/podcast-1.0.dtd}'
 
+    SY_PREFIX = '{http://purl.org/rss/1.0/modules/syndication/}'
+
+    SY_PERIODS = {
+        'hourly': 3600,
+        'daily': 86400,
+        'weekly': 604800,
+        'monthly': 2592000,
+        'yearly': 31536000
+    }
+
+    # number of recent episodes used for estimating publishing cadence
+    CADENCE_ITEMS = 10
+
     DURATION_RE = re.compile(r"""
     (?:
       (?:(?P<hours>\d+):)?
@@ -69,43 +134,94 @@ class RssFeed(PodcastFeed):
 
     def __init__(self, url, root):
         super(RssFeed, self).__init__(url)
-        self.__channel = channel = root.find('channel')
-        items = channel.findall('./item/enclosure[@url]/..')
-        self.__items = list(sorted(items, key=self.__order))
+        channel = root.find('channel')
+        elems = self.__children(channel)
+        self.__channel = RssChannel(
+            title=self.__findtext(elems, 'title'),
+            author=self.__text(elems, self.ITUNES_PREFIX + 'author'),
+            category=self.__attr(elems, self.ITUNES_PREFIX + 'category',
+                                 'text'),
+            image=self.__attr(elems, self.ITUNES_PREFIX + 'image', 'href'),
+            ttl=self.__findtext(elems, 'ttl'),
+            update_period=self.__findtext(
+                elems, self.SY_PREFIX + 'updatePeriod'
+            ),
+            update_frequency=self.__findtext(
+                elems, self.SY_PREFIX + 'updateFrequency'
+            )
+        )
+        # visit child elements only once instead of using ElementPath
+        # expressions, which are comparatively slow for some engines
+        items = (self.__item(e) for e in channel if e.tag == 'item')
+        self.__items = sorted(filter(None, items), key=self.__order)
 
     def getstreamuri(self, guid):
         for item in self.__items:
-            if self.__guid(item) == guid:
-                return item.find('enclosure').get('url')
+            if item.guid == guid:
+                return item.url
         return None
 
+    def ttl(self, now=None):
+        channel = self.__channel
+        try:
+            return int(channel.ttl) * 60  # RSS <ttl> is in minutes
+        except (TypeError, ValueError):
+            pass
+        if channel.update_period or channel.update_frequency:
+            period = (channel.update_period or 'daily').strip().lower()
+            try:
+                frequency = max(int(channel.update_frequency or 1), 1)
+            except ValueError:
+                frequency = 1
+            if period in self.SY_PERIODS:
+                return self.SY_PERIODS[period] // frequency
+        # estimate from the publishing cadence of recent episodes
+        timestamps = [self.__timestamp(item.pubdate)
+                      for item in self.__items[-self.CADENCE_ITEMS:]]
+        timestamps = [t for t in timestamps if t is not None]
+        if len(timestamps) < 2:
+            return None
+        intervals = sorted(b - a for a, b in zip(timestamps, timestamps[1:]))
+        median = intervals[len(intervals) // 2]
+        age = (time.time() if now is None else now) - timestamps[-1]
+        return max(median, age) // 2
+
     def items(self, newest_first=False):
         for item in (reversed(self.__items) if newest_first else self.__items):
             yield models.Ref.track(
-                uri=self.getitemuri(self.__guid(item)),
-                name=item.findtext('title')
+                uri=self.getitemuri(item.guid),
+                name=item.title
             )
 
-    def tracks(self, newest_first=False):
+    def tracks(self, newest_first=False, limit=None, since=None):
         album = models.Album(
             uri=self.uri,
-            name=self.__channel.findtext('title'),
+            name=self.__channel.title,
             artists=self.__artists(self.__channel),
             num_tracks=len(self.__items)
         )
-        genre = self.__genre(self.__channel)
-        items = enumerate(self.__items, start=1)
-        for index, item in (reversed(list(items)) if newest_first else items):
+        genre = self.__channel.category
+        # select the newest items by index, since items are sorted
+        stop = len(self.__items)
+        start = self.__bisect(since) if since is not None else 0
+        if limit is not None:
+            start = max(start, stop - limit)
+        if newest_first:
+            indices = xrange(stop - 1, start - 1, -1)
+        else:
+            indices = xrange(start, stop)
+        for index in indices:
+            item = self.__items[index]
             yield models.Track(
-                uri=self.getitemuri(self.__guid(item)),
-                name=item.findtext('title'),
+                uri=self.getitemuri(item.guid),
+                name=item.title,
                 album=album,
                 artists=(self.__artists(item) or album.artists),
                 genre=genre,
                 date=self.__date(item),
                 length=self.__length(item),
-                comment=item.findtext('description'),
-                track_no=index
+                comment=item.description,
+                track_no=index + 1
             )
 
     def images(self):
@@ -116,59 +232,81 @@ class RssFeed(PodcastFeed):
         for item in self.__items:
             image = self.__image(item)
             if image:
-                yield self.getitemuri(self.__guid(item)), [image]
+                yield self.getitemuri(item.guid), [image]
             elif default:
-                yield self.getitemuri(self.__guid(item)), default
+                yield self.getitemuri(item.guid), default
             else:
                 pass
 
+    def latest(self, count):
+        for item in itertools.islice(reversed(self.__items), count):
+            ref = models.Ref.track(uri=self.getitemuri(item.guid),
+                                   name=item.title)
+            yield self.__order(item), ref
+
+    def streams(self):
+        for item in self.__items:
+            yield self.getitemuri(item.guid), item.url
+
+    def __bisect(self, timestamp):
+        lo, hi = 0, len(self.__items)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.__order(self.__items[mid]) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
     @classmethod
-    def __artists(cls, etree):
-        elem = etree.find(cls.ITUNES_PREFIX + 'author')
-        if elem is not None:
-            return [models.Artist(name=elem.text)]
+    def __item(cls, etree):
+        # only items with an enclosure URL are considered episodes
+        for elem in etree:
+            if elem.tag == 'enclosure' and elem.get('url') is not None:
+                url = elem.get('url')
+                break
         else:
             return None
+        elems = cls.__children(etree)
+        return RssItem(
+            guid=(cls.__findtext(elems, 'guid') or url),
+            title=cls.__findtext(elems, 'title'),
+            url=url,
+            author=cls.__text(elems, cls.ITUNES_PREFIX + 'author'),
+            image=cls.__attr(elems, cls.ITUNES_PREFIX + 'image', 'href'),
+            duration=cls.__findtext(elems, cls.ITUNES_PREFIX + 'duration'),
+            pubdate=cls.__findtext(elems, 'pubDate'),
+            description=cls.__findtext(elems, 'description')
+        )
 
     @classmethod
-    def __date(cls, etree):
-        text = etree.findtext('pubDate')
-        try:
-            timestamp = email.utils.mktime_tz(email.utils.parsedate_tz(text))
-        except AttributeError:
-            return None
-        except TypeError:
-            return None
+    def __artists(cls, item):
+        if item.author is not None:
+            return [models.Artist(name=item.author)]
         else:
+            return None
+
+    @classmethod
+    def __date(cls, item):
+        timestamp = cls.__timestamp(item.pubdate)
+        if timestamp is not None:
             return datetime.datetime.utcfromtimestamp(
                 timestamp,
             ).date().isoformat()
-
-    @classmethod
-    def __genre(cls, etree):
-        elem = etree.find(cls.ITUNES_PREFIX + 'category')
-        if elem is not None:
-            return elem.get('text')
         else:
             return None
 
     @classmethod
-    def __guid(cls, etree):
-        return etree.findtext('guid') or etree.find('enclosure').get('url')
-
-    @classmethod
-    def __image(cls, etree):
-        elem = etree.find(cls.ITUNES_PREFIX + 'image')
-        if elem is not None:
-            return models.Image(uri=elem.get('href'))
+    def __image(cls, item):
+        if item.image is not None:
+            return models.Image(uri=item.image)
         else:
             return None
 
     @classmethod
-    def __length(cls, etree):
-        text = etree.findtext(cls.ITUNES_PREFIX + 'duration')
+    def __length(cls, item):
         try:
-            groups = cls.DURATION_RE.match(text).groupdict('0')
+            groups = cls.DURATION_RE.match(item.duration).groupdict('0')
         except AttributeError:
             return None
         except TypeError:
@@ -177,17 +315,52 @@ class RssFeed(PodcastFeed):
             d = datetime.timedelta(**{k: int(v) for k, v in groups.items()})
             return int(d.total_seconds() * 1000)
 
+    @classmethod
+    def __order(cls, item):
+        timestamp = cls.__timestamp(item.pubdate)
+        return timestamp if timestamp is not None else 0
+
+    @staticmethod
+    def __children(etree):
+        # map tags to their first child elements, like Element.find()
+        elems = {}
+        for elem in reversed(etree):
+            elems[elem.tag] = elem
+        return elems
+
+    @staticmethod
+    def __attr(elems, tag, key):
+        elem = elems.get(tag)
+        if elem is not None:
+            return elem.get(key)
+        else:
+            return None
+
     @staticmethod
-    def __order(etree):
-        text = etree.findtext('pubDate')
+    def __findtext(elems, tag):
+        # like Element.findtext(), return '' for elements without text
+        elem = elems.get(tag)
+        if elem is not None:
+            return elem.text or ''
+        else:
+            return None
+
+    @staticmethod
+    def __text(elems, tag):
+        elem = elems.get(tag)
+        if elem is not None:
+            return elem.text
+        else:
+            return None
+
+    @staticmethod
+    def __timestamp(text):
         try:
-            timestamp = email.utils.mktime_tz(email.utils.parsedate_tz(text))
+            return email.utils.mktime_tz(email.utils.parsedate_tz(text))
         except AttributeError:
-            return 0
+            return None
         except TypeError:
-            return 0
-        else:
-            return timestamp
+            return None
 
 
 class OpmlFeed(PodcastFeed):  # not really a "feed"
@@ -214,7 +387,8 @@ class OpmlFeed(PodcastFeed):  # not really a "feed"
 
     def __init__(self, url, root):
         super(OpmlFeed, self).__init__(url)
-        self.__outlines = root.findall('./body//outline[@type]')
+        outlines = root.findall('./body//outline[@type]')
+        self.__outlines = [dict(e.attrib) for e in outlines]
 
     def items(self, newest_first=None):
         for e in self.__outlines:
@@ -224,30 +398,3 @@ class OpmlFeed(PodcastFeed):  # not really a "feed"
                 pass
             else:
                 yield ref(e)
-
-
-if __name__ == '__main__':  # pragma: no cover
-    import argparse
-    import contextlib
-    import json
-    import urllib2
-    import sys
-
-    from mopidy.models import ModelJSONEncoder
-
-    parser = argparse.ArgumentParser()
-    parser.add_argument('url', metavar='URL')
-    parser.add_argument('-i', '--images', action='store_true')
-    parser.add_argument('-t', '--tracks', action='store_true')
-    args = parser.parse_args()
-
-    with contextlib.closing(urllib2.urlopen(args.url)) as source:
-        feed = PodcastFeed.parse(source)
-    if args.tracks:
-        result = list(feed.tracks())
-    elif args.images:
-        result = dict(feed.images())
-    else:
-        result = list(feed.items())
-    json.dump(result, sys.stdout, cls=ModelJSONEncoder, indent=2)
-    sys.stdout.write('\n')
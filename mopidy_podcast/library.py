@@ -1,36 +1,20 @@
 from __future__ import unicode_literals
 
+import heapq
 import itertools
-import locale
 import logging
 import os
+import time
 
 from mopidy import backend, models
 
-import uritools
-
 from . import Extension
+from .profiling import profiled
+from .util import get_config_dir
 
 logger = logging.getLogger(__name__)
 
-
-def strerror(error):
-    if isinstance(error.strerror, bytes):
-        return error.strerror.decode(locale.getpreferredencoding())
-    else:
-        return error.strerror
-
-
-def get_config_dir(config):
-    try:
-        return Extension.get_config_dir(config)
-    except EnvironmentError as e:
-        logger.warning('Cannot access %s config directory: %s',
-                       Extension.dist_name, strerror(e))
-    except Exception as e:
-        logger.warning('Cannot access %s config directory: %s',
-                       Extension.dist_name, e)
-    return None
+LATEST_EPISODES_URI = 'podcast:latest'
 
 
 class PodcastLibraryProvider(backend.LibraryProvider):
@@ -41,10 +25,16 @@ class PodcastLibraryProvider(backend.LibraryProvider):
         self.__browse_root = config[Extension.ext_name]['browse_root']
         self.__browse_order = config[Extension.ext_name]['browse_order']
         self.__lookup_order = config[Extension.ext_name]['lookup_order']
+        self.__lookup_limit = config[Extension.ext_name]['lookup_limit']
+        self.__lookup_max_age = config[Extension.ext_name]['lookup_max_age']
+        self.__latest_episodes = config[Extension.ext_name]['latest_episodes']
+        self.__latest = {}  # newest episodes per feed for merging
+        self.__merged = []
         self.__tracks = {}  # cache tracks for faster lookup
 
     @property
     def root_directory(self):
+        import uritools
         root = self.__browse_root
         if not root:
             return None
@@ -59,7 +49,26 @@ class PodcastLibraryProvider(backend.LibraryProvider):
             return None
         return models.Ref.directory(name='Podcasts', uri=uri)
 
+    @profiled
     def browse(self, uri):
+        if uri == LATEST_EPISODES_URI:
+            return self.__browse_latest()
+        root = self.root_directory
+        if self.__latest_episodes and root and uri == root.uri:
+            latest = models.Ref.directory(
+                name='Latest Episodes',
+                uri=LATEST_EPISODES_URI
+            )
+            return [latest] + self.__browse(uri)
+        else:
+            return self.__browse(uri)
+
+    def __browse(self, uri):
+        store = self.__episode_store(uri)
+        if store is not None:
+            refs = store.items(uri, self.__browse_order == 'desc', time.time())
+            if refs is not None:
+                return refs
         try:
             feed = self.backend.feeds[uri]
         except Exception as e:
@@ -68,10 +77,14 @@ class PodcastLibraryProvider(backend.LibraryProvider):
             return list(feed.items(self.__browse_order == 'desc'))
         return []  # FIXME: hide errors from clients
 
+    @profiled
     def get_images(self, uris):
+        import uritools
+
         def key(uri):
             return uritools.uridefrag(uri).uri
         result = {}
+        uris = [uri for uri in uris if uri != LATEST_EPISODES_URI]
         for feeduri, uris in itertools.groupby(sorted(uris, key=key), key=key):
             try:
                 images = dict(self.backend.feeds[feeduri].images())
@@ -79,9 +92,14 @@ class PodcastLibraryProvider(backend.LibraryProvider):
                 logger.error('Error retrieving images for %s: %s', feeduri, e)
             else:
                 result.update((uri, images.get(uri, [])) for uri in uris)
+        if self.backend.artwork is not None:
+            for uri, images in result.items():
+                result[uri] = self.backend.artwork.images(images)
         return result
 
+    @profiled
     def lookup(self, uri):
+        import uritools
         # pop from __tracks since cached tracks shouldn't live too long
         try:
             track = self.__tracks.pop(uri)
@@ -89,6 +107,20 @@ class PodcastLibraryProvider(backend.LibraryProvider):
             logger.debug('Lookup cache miss: %s', uri)
         else:
             return [track]
+        if uri == LATEST_EPISODES_URI:
+            return self.__lookup_latest()
+        store = self.__episode_store(uri)
+        if store is not None and '#' in uri:
+            track = store.track(uri, time.time())
+            if track is not None:
+                return [track]
+        elif store is not None:
+            tracks = store.tracks(
+                uri, self.__lookup_order == 'desc', time.time(),
+                **self.__lookup_window()
+            )
+            if tracks is not None:
+                return tracks
         try:
             feed = self.backend.feeds[uritools.uridefrag(uri).uri]
         except Exception as e:
@@ -97,16 +129,89 @@ class PodcastLibraryProvider(backend.LibraryProvider):
             return self.__lookup(feed, uri)
         return []  # FIXME: hide errors from clients
 
+    @profiled
     def refresh(self, uri=None):
+        import uritools
+        # stale feeds will be served until replacements are retrieved
         if uri:
-            self.backend.feeds.pop(uritools.uridefrag(uri).uri, None)
+            self.backend.feeds.expire(uritools.uridefrag(uri).uri)
         else:
-            self.backend.feeds.clear()
+            self.backend.feeds.expire()
+        if self.backend.episodes is not None:
+            self.backend.episodes.expire(uri and uritools.uridefrag(uri).uri)
         self.__tracks.clear()
 
+    def __browse_latest(self):
+        root = self.root_directory
+        if not self.__latest_episodes or not root:
+            return []
+        try:
+            refs = self.backend.feeds[root.uri].items()
+        except Exception as e:
+            logger.error('Error retrieving %s: %s', root.uri, e)
+            return []
+        uris = set(ref.uri for ref in refs if ref.type == models.Ref.ALBUM)
+        count = self.__latest_episodes
+        latest = {}
+        changed = uris != set(self.__latest)
+        for uri in uris:
+            expires, episodes = self.__latest.get(uri, (None, None))
+            entry = self.backend.feeds.peek(uri)
+            if entry is None and episodes is None:
+                # retrieve feeds only once, later update if still cached
+                try:
+                    self.backend.feeds[uri]
+                except Exception as e:
+                    logger.warning('Error retrieving %s: %s', uri, e)
+                    continue
+                entry = self.backend.feeds.peek(uri)
+            if entry is not None and entry.expires != expires:
+                # sort newest first, using feed URI and index to break ties
+                episodes = [(-timestamp, uri, index, ref)
+                            for index, (timestamp, ref)
+                            in enumerate(entry.feed.latest(count))]
+                expires = entry.expires
+                changed = True
+            if episodes is not None:
+                latest[uri] = (expires, episodes)
+        if changed:
+            # merge per-feed episode lists, which are already sorted
+            merged = heapq.merge(*(v[1] for v in latest.values()))
+            merged = itertools.islice(merged, count)
+            self.__merged = [item[-1] for item in merged]
+            self.__latest = latest
+        return list(self.__merged)
+
+    def __lookup_latest(self):
+        import uritools
+        refs = self.__browse_latest()
+        tracks = {}
+        for uri in set(uritools.uridefrag(ref.uri).uri for ref in refs):
+            try:
+                feed = self.backend.feeds[uri]
+            except Exception as e:
+                logger.warning('Error retrieving %s: %s', uri, e)
+            else:
+                tracks.update((t.uri, t) for t in feed.tracks())
+        return [tracks[ref.uri] for ref in refs if ref.uri in tracks]
+
+    def __episode_store(self, uri):
+        import uritools
+        # only use the episode store for feeds that are not cached
+        store = self.backend.episodes
+        if store is None or not uri:
+            return None
+        elif uritools.uridefrag(uri).uri in self.backend.feeds:
+            return None
+        else:
+            return store
+
     def __lookup(self, feed, uri):
         if uri == feed.uri:
-            return list(feed.tracks(self.__lookup_order == 'desc'))
+            return list(feed.tracks(
+                self.__lookup_order == 'desc',
+                **self.__lookup_window()
+            ))
         else:
             self.__tracks = tracks = {t.uri: t for t in feed.tracks()}
             try:
@@ -115,3 +220,10 @@ class PodcastLibraryProvider(backend.LibraryProvider):
                 logger.warning('No such track: %s', uri)  # TODO: raise?
             else:
                 return [track]
+
+    def __lookup_window(self):
+        if self.__lookup_max_age:
+            since = time.time() - self.__lookup_max_age
+        else:
+            since = None
+        return {'limit': self.__lookup_limit, 'since': since}
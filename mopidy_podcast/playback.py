@@ -4,14 +4,27 @@ import logging
 
 from mopidy import backend
 
-import uritools
+from .profiling import profiled
 
 logger = logging.getLogger(__name__)
 
 
 class PodcastPlaybackProvider(backend.PlaybackProvider):
 
+    @profiled
     def translate_uri(self, uri):
+        import uritools
+        # resolve indexed episodes without retrieving their feeds
+        for store in (self.backend.streams, self.backend.episodes):
+            if store is None:
+                continue
+            try:
+                url = store.streamuri(uri)
+            except Exception as e:
+                logger.warning('Error looking up stream of %s: %s', uri, e)
+            else:
+                if url is not None:
+                    return url
         parts = uritools.uridefrag(uri)
         try:
             feed = self.backend.feeds[parts.uri]
@@ -0,0 +1,75 @@
+from __future__ import unicode_literals
+
+import cProfile
+import functools
+import logging
+import os
+import random
+import re
+import time
+import timeit
+
+logger = logging.getLogger(__name__)
+
+UNSAFE_CHARS_RE = re.compile(r'[^A-Za-z0-9.+-]+')
+
+
+def profiled(func):
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        profiler = self.backend.profiler
+        if profiler is None:
+            return func(self, *args, **kwargs)
+        # label profile data with the (first) URI passed
+        uri = args[0] if args else None
+        if isinstance(uri, (list, tuple)):
+            uri = uri[0] if uri else None
+        return profiler.run(func.__name__, uri, func, self, *args, **kwargs)
+    return wrapper
+
+
+class Profiler(object):
+
+    def __init__(self, path, threshold, sample=100, count=100):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.__path = path
+        self.__threshold = threshold / 1000.0
+        self.__sample = sample / 100.0
+        self.__count = count
+
+    def run(self, operation, label, func, *args, **kwargs):
+        if random.random() >= self.__sample:
+            return func(*args, **kwargs)
+        profile = cProfile.Profile()
+        start = timeit.default_timer()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            elapsed = timeit.default_timer() - start
+            if elapsed >= self.__threshold:
+                self.__dump(profile, operation, label, elapsed)
+
+    def __dump(self, profile, operation, label, elapsed):
+        now = time.time()
+        name = '%s.%06d-%s-%s.prof' % (
+            time.strftime('%Y%m%dT%H%M%S', time.localtime(now)),
+            int(now % 1 * 1e6),
+            operation,
+            UNSAFE_CHARS_RE.sub('_', label or '')[:100]
+        )
+        path = os.path.join(self.__path, name)
+        try:
+            profile.dump_stats(path)
+            self.__rotate()
+        except Exception as e:
+            logger.warning('Error writing profile data: %s', e)
+        else:
+            logger.info('%s(%s) took %d ms; profile data written to %s',
+                        operation, label, elapsed * 1000, path)
+
+    def __rotate(self):
+        names = sorted(n for n in os.listdir(self.__path)
+                       if n.endswith('.prof'))
+        for name in names[:-self.__count]:
+            os.remove(os.path.join(self.__path, name))
@@ -0,0 +1,424 @@
+from __future__ import unicode_literals
+
+import collections
+import contextlib
+import errno
+import fcntl
+import hashlib
+import itertools
+import logging
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+logger = logging.getLogger(__name__)
+
+FeedEntry = collections.namedtuple('FeedEntry', ['feed', 'expires'])
+
+
+class FeedStore(object):
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, entry):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def keys(self):
+        raise NotImplementedError
+
+    def lock(self, key):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+# Adaptive Replacement Cache (Megiddo and Modha, 2003), balancing
+# recently and frequently used entries and keeping only keys of
+# evicted entries in "ghost" lists to adapt its target sizes.
+def lrucache(maxsize):
+    import cachetools  # only needed for the default policy
+    return cachetools.LRUCache(maxsize=maxsize)
+
+
+class ARCCache(collections.MutableMapping):
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.__t1 = collections.OrderedDict()  # seen once recently
+        self.__t2 = collections.OrderedDict()  # seen at least twice
+        self.__b1 = collections.OrderedDict()  # evicted from t1
+        self.__b2 = collections.OrderedDict()  # evicted from t2
+        self.__p = 0  # target size of t1
+
+    def __contains__(self, key):
+        return key in self.__t1 or key in self.__t2
+
+    def __getitem__(self, key):
+        if key in self.__t1:
+            value = self.__t2[key] = self.__t1.pop(key)
+        else:
+            value = self.__t2[key] = self.__t2.pop(key)
+        return value
+
+    def __setitem__(self, key, value):
+        t1, t2, b1, b2 = self.__t1, self.__t2, self.__b1, self.__b2
+        c = self.maxsize
+        if key in t1:
+            t1[key] = value
+        elif key in t2:
+            t2[key] = value
+        elif key in b1:
+            self.__p = min(c, self.__p + max(len(b2) // len(b1), 1))
+            self.__replace(False)
+            del b1[key]
+            t2[key] = value
+        elif key in b2:
+            self.__p = max(0, self.__p - max(len(b1) // len(b2), 1))
+            self.__replace(True)
+            del b2[key]
+            t2[key] = value
+        else:
+            if len(t1) + len(b1) >= c:
+                if len(t1) < c:
+                    b1.popitem(last=False)
+                    self.__replace(False)
+                else:
+                    t1.popitem(last=False)
+            elif len(t1) + len(t2) + len(b1) + len(b2) >= c:
+                if len(t1) + len(t2) + len(b1) + len(b2) >= 2 * c:
+                    b2.popitem(last=False)
+                self.__replace(False)
+            t1[key] = value
+
+    def __delitem__(self, key):
+        if key in self.__t1:
+            del self.__t1[key]
+        else:
+            del self.__t2[key]
+
+    def __iter__(self):
+        return itertools.chain(list(self.__t1), list(self.__t2))
+
+    def __len__(self):
+        return len(self.__t1) + len(self.__t2)
+
+    def __replace(self, inb2):
+        t1, t2 = self.__t1, self.__t2
+        if len(t1) + len(t2) < self.maxsize:
+            return  # entries may have been deleted explicitly
+        if t1 and (len(t1) > self.__p or (inb2 and len(t1) == self.__p)):
+            key, _ = t1.popitem(last=False)
+            self.__b1[key] = None
+        elif t2:
+            key, _ = t2.popitem(last=False)
+            self.__b2[key] = None
+        else:
+            key, _ = t1.popitem(last=False)
+            self.__b1[key] = None
+
+
+# W-TinyLFU (Einziger, Friedman and Manes, 2017), admitting new entries
+# from a small LRU window into a segmented LRU main cache only if they
+# have been used more often than the main cache's eviction candidate.
+# Access frequencies are counted exactly, and halved periodically so
+# that old popularity fades.
+class TinyLFUCache(collections.MutableMapping):
+
+    WINDOW_RATIO = 0.01
+    PROTECTED_RATIO = 0.8
+    SAMPLE_RATIO = 10
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.__window = collections.OrderedDict()
+        self.__probation = collections.OrderedDict()
+        self.__protected = collections.OrderedDict()
+        self.__windowsize = max(1, int(maxsize * self.WINDOW_RATIO))
+        self.__mainsize = max(0, maxsize - self.__windowsize)
+        self.__protectedsize = int(self.__mainsize * self.PROTECTED_RATIO)
+        self.__counts = collections.Counter()
+        self.__samples = 0
+
+    def __contains__(self, key):
+        return (key in self.__window or key in self.__probation or
+                key in self.__protected)
+
+    def __getitem__(self, key):
+        self.__record(key)
+        if key in self.__window:
+            value = self.__window[key] = self.__window.pop(key)
+        elif key in self.__protected:
+            value = self.__protected[key] = self.__protected.pop(key)
+        else:
+            value = self.__protected[key] = self.__probation.pop(key)
+            if len(self.__protected) > self.__protectedsize:
+                k, v = self.__protected.popitem(last=False)
+                self.__probation[k] = v
+        return value
+
+    def __setitem__(self, key, value):
+        for segment in (self.__window, self.__probation, self.__protected):
+            if key in segment:
+                segment[key] = value
+                return
+        self.__window[key] = value
+        if len(self.__window) > self.__windowsize:
+            self.__admit(*self.__window.popitem(last=False))
+
+    def __delitem__(self, key):
+        for segment in (self.__window, self.__probation, self.__protected):
+            if key in segment:
+                del segment[key]
+                return
+        raise KeyError(key)
+
+    def __iter__(self):
+        return itertools.chain(
+            list(self.__window), list(self.__probation),
+            list(self.__protected)
+        )
+
+    def __len__(self):
+        return (len(self.__window) + len(self.__probation) +
+                len(self.__protected))
+
+    def __admit(self, key, value):
+        probation, protected = self.__probation, self.__protected
+        if len(probation) + len(protected) < self.__mainsize:
+            probation[key] = value
+            return
+        victims = probation or protected
+        if not victims:
+            return
+        victim = next(iter(victims))
+        if self.__counts[key] > self.__counts[victim]:
+            del victims[victim]
+            probation[key] = value
+
+    def __record(self, key):
+        self.__counts[key] += 1
+        self.__samples += 1
+        if self.__samples >= self.maxsize * self.SAMPLE_RATIO:
+            for k, n in list(self.__counts.items()):
+                if n > 1:
+                    self.__counts[k] = n // 2
+                else:
+                    del self.__counts[k]
+            self.__samples //= 2
+
+
+class MemoryStore(FeedStore):
+
+    POLICIES = {
+        'lru': lrucache,
+        'arc': ARCCache,
+        'tinylfu': TinyLFUCache
+    }
+
+    def __init__(self, maxsize, policy='lru'):
+        self.__cache = self.POLICIES[policy](maxsize=maxsize)
+        self.__policy = policy
+        self.__locks = {}
+        self.__lock = threading.Lock()
+        self.__hits = self.__misses = 0
+
+    def get(self, key):
+        with self.__lock:
+            try:
+                entry = self.__cache[key]
+            except KeyError:
+                self.__misses += 1
+                return None
+            else:
+                self.__hits += 1
+                return entry
+
+    def set(self, key, entry):
+        with self.__lock:
+            self.__cache[key] = entry
+
+    def delete(self, key):
+        with self.__lock:
+            self.__cache.pop(key, None)
+
+    def clear(self):
+        with self.__lock:
+            self.__cache.clear()
+
+    def keys(self):
+        with self.__lock:
+            return list(self.__cache.keys())
+
+    def stats(self):
+        with self.__lock:
+            return {
+                'policy': self.__policy,
+                'size': len(self.__cache),
+                'maxsize': self.__cache.maxsize,
+                'hits': self.__hits,
+                'misses': self.__misses
+            }
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        with self.__lock:
+            lock, count = self.__locks.get(key, (None, 0))
+            self.__locks[key] = (lock or threading.Lock(), count + 1)
+            lock = self.__locks[key][0]
+        try:
+            with lock:
+                yield
+        finally:
+            with self.__lock:
+                lock, count = self.__locks.pop(key)
+                if count > 1:
+                    self.__locks[key] = (lock, count - 1)
+
+
+# Feeds are stored in files named by the SHA-1 digest of their key,
+# holding a small (key, expires) header pickle followed by the entry
+# itself, so keys and expiration times can be read cheaply.  Since the
+# store may be shared between Mopidy instances, clear() removes cached
+# feeds for all of them.
+class FileStore(FeedStore):
+
+    # minimum number of seconds between sweeps for outdated files
+    SWEEP_INTERVAL = 3600
+
+    def __init__(self, path, maxage=None, timer=time.time):
+        try:
+            os.makedirs(path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        self.__path = path
+        self.__maxage = maxage
+        self.__timer = timer
+        self.__swept = None
+
+    def get(self, key):
+        try:
+            with open(self.__filename(key, '.pickle'), 'rb') as f:
+                stored, _ = pickle.load(f)
+                return pickle.load(f) if stored == key else None
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                logger.warning('Error reading cached feed %s: %s', key, e)
+            return None
+        except Exception as e:
+            logger.warning('Error reading cached feed %s: %s', key, e)
+            return None
+
+    def set(self, key, entry):
+        fd, tmpname = tempfile.mkstemp(dir=self.__path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((key, entry.expires), f, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+            # atomically replace, so readers never see partial files
+            os.rename(tmpname, self.__filename(key, '.pickle'))
+        except Exception:
+            os.remove(tmpname)
+            raise
+        if self.__maxage is not None:
+            now = self.__timer()
+            swept = self.__swept
+            if swept is None or swept + self.SWEEP_INTERVAL < now:
+                self.__swept = now
+                self.sweep(now - self.__maxage)
+
+    def delete(self, key):
+        self.__remove(self.__filename(key, '.pickle'))
+
+    def clear(self):
+        for _, filename in self.__headers():
+            self.__remove(filename)
+
+    def keys(self):
+        return [header[0] for header, _ in self.__headers()]
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        # flock() locks are bound to open files, so this also serializes
+        # threads within a single process
+        filename = self.__filename(key, '.lock')
+        while True:
+            f = open(filename, 'a')
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                # lock files may be removed by sweep() while waiting
+                if self.__isfile(f, filename):
+                    break
+            except Exception:
+                f.close()
+                raise
+            f.close()
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            f.close()
+
+    def sweep(self, before):
+        for (key, expires), filename in self.__headers():
+            if expires < before:
+                logger.debug('Removing outdated cached feed %s', key)
+                self.__remove(filename)
+        for name in os.listdir(self.__path):
+            if name.endswith('.lock'):
+                self.__sweep_lock(os.path.join(self.__path, name))
+
+    def __filename(self, key, ext):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.__path, digest + ext)
+
+    def __headers(self):
+        for name in os.listdir(self.__path):
+            if not name.endswith('.pickle'):
+                continue
+            filename = os.path.join(self.__path, name)
+            try:
+                with open(filename, 'rb') as f:
+                    yield pickle.load(f), filename
+            except Exception as e:
+                logger.debug('Error reading cached feed %s: %s', name, e)
+
+    def __isfile(self, f, filename):
+        try:
+            return os.fstat(f.fileno()).st_ino == os.stat(filename).st_ino
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return False
+
+    def __remove(self, filename):
+        try:
+            os.remove(filename)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def __sweep_lock(self, filename):
+        try:
+            with open(filename, 'a') as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                # only remove unused lock files while holding the lock
+                if self.__isfile(f, filename):
+                    os.remove(filename)
+        except IOError as e:
+            if e.errno not in (errno.EAGAIN, errno.EACCES, errno.ENOENT):
+                logger.debug('Error removing lock file %s: %s', filename, e)
@@ -0,0 +1,39 @@
+from __future__ import unicode_literals
+
+import locale
+import logging
+
+from . import Extension
+
+logger = logging.getLogger(__name__)
+
+
+def strerror(error):
+    if isinstance(error.strerror, bytes):
+        return error.strerror.decode(locale.getpreferredencoding())
+    else:
+        return error.strerror
+
+
+def get_config_dir(config):
+    try:
+        return Extension.get_config_dir(config)
+    except EnvironmentError as e:
+        logger.warning('Cannot access %s config directory: %s',
+                       Extension.dist_name, strerror(e))
+    except Exception as e:
+        logger.warning('Cannot access %s config directory: %s',
+                       Extension.dist_name, e)
+    return None
+
+
+def get_data_dir(config):
+    try:
+        return Extension.get_data_dir(config)
+    except EnvironmentError as e:
+        logger.warning('Cannot access %s data directory: %s',
+                       Extension.dist_name, strerror(e))
+    except Exception as e:
+        logger.warning('Cannot access %s data directory: %s',
+                       Extension.dist_name, e)
+    return None
@@ -29,6 +29,9 @@ setup(
         'cachetools >= 1.0',
         'uritools >= 1.0'
     ],
+    extras_require={
+        'artwork': ['Pillow']
+    },
     entry_points={
         'mopidy.ext': [
             'podcast = mopidy_podcast:Extension',
@@ -27,9 +27,31 @@ def config():
             'browse_root': 'Podcasts.opml',
             'browse_order': 'desc',
             'lookup_order': 'asc',
+            'lookup_limit': None,
+            'lookup_max_age': None,
+            'latest_episodes': 0,
             'cache_size': 64,
+            'cache_policy': 'lru',
             'cache_ttl': 86400,
-            'timeout': 10
+            'cache_ttl_min': 3600,
+            'cache_ttl_max': 604800,
+            'cache_warmup': 0,
+            'shared_cache_dir': None,
+            'canonical_uris': True,
+            'ignore_query_params': ['utm_*'],
+            'artwork_dir': None,
+            'artwork_cache_size': 104857600,
+            'artwork_sizes': ['300', '600'],
+            'timeout': 10,
+            'episode_store': None,
+            'stream_index': None,
+            'profile_threshold': None,
+            'profile_sample': 100,
+            'profile_dir': 'profiles',
+            'profile_count': 100,
+            'parse_workers': 0,
+            'parse_threshold': 1048576,
+            'xml_engine': None
         },
         'core': {
             'config_dir': os.path.dirname(__file__)
@@ -0,0 +1,332 @@
+from __future__ import division, print_function, unicode_literals
+
+import BaseHTTPServer
+import ConfigParser
+import SocketServer
+import argparse
+import bisect
+import collections
+import email.utils
+import io
+import logging
+import os
+import random
+import threading
+import time
+import timeit
+import urlparse
+
+from mopidy import models
+
+from mopidy_podcast import Extension, backend
+
+RSS_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<rss xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd" version="2.0">
+<channel>
+<title>Podcast %(id)s</title>
+<itunes:author>Author %(id)s</itunes:author>
+<itunes:image href="http://example.com/%(id)s.jpg" />
+%(items)s
+</channel>
+</rss>
+"""
+
+ITEM_TEMPLATE = """<item>
+<title>Episode %(index)d</title>
+<guid>%(id)s-%(index)d</guid>
+<enclosure url="http://example.com/%(id)s/%(index)d.mp3" type="audio/mpeg"/>
+<pubDate>%(date)s</pubDate>
+<itunes:duration>%(duration)s</itunes:duration>
+<description>%(description)s</description>
+</item>
+"""
+
+OPML_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<opml version="2.0">
+<body>
+%s
+</body>
+</opml>
+"""
+
+
+def generate_rss(id, episodes, padding=0, now=1400000000):
+    items = [ITEM_TEMPLATE % {
+        'id': id,
+        'index': index,
+        'date': email.utils.formatdate(now - index * 86400, usegmt=True),
+        'duration': '%d:%02d' % divmod(index % 3600, 60),
+        'description': 'x' * padding
+    } for index in range(episodes)]
+    return (RSS_TEMPLATE % {'id': id, 'items': ''.join(items)}).encode('utf-8')
+
+
+class FeedRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        path = urlparse.urlsplit(self.path).path
+        kind, _, id = path.strip('/').partition('/')
+        server.count(path)
+        mode = server.mode(id)
+        time.sleep(server.latency)
+        if kind == 'podcasts.opml':
+            self.__send(server.opml(), 'text/x-opml')
+        elif kind == 'moved':
+            self.send_response(301)
+            self.send_header('Location', '/feed/' + id)
+            self.end_headers()
+        elif kind != 'feed':
+            self.send_error(404)
+        elif mode == 'error':
+            self.send_error(500)
+        elif mode == 'timeout':
+            time.sleep(server.timeout)
+            self.send_error(504)
+        else:
+            self.__send(server.feed(id), 'application/rss+xml')
+
+    def log_message(self, format, *args):
+        pass
+
+    def __send(self, data, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+# Serves an OPML directory at /podcasts.opml listing generated RSS feeds
+# at /feed/<id>, or /moved/<id> permanently redirecting to /feed/<id>.
+# Failure modes are chosen by feed id, so repeated requests for the same
+# feed behave consistently.
+class FeedServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, feeds=10, episodes=100, padding=0, latency=0,
+                 timeout=1, error_rate=0, timeout_rate=0, redirect_rate=0):
+        BaseHTTPServer.HTTPServer.__init__(
+            self, ('127.0.0.1', 0), FeedRequestHandler
+        )
+        self.feeds = feeds
+        self.episodes = episodes
+        self.padding = padding
+        self.latency = latency
+        self.timeout = timeout
+        self.rates = [
+            ('error', error_rate),
+            ('timeout', timeout_rate),
+            ('redirect', redirect_rate)
+        ]
+        self.counts = collections.Counter()
+        self.__cache = {}
+        self.__lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address
+
+    def count(self, path):
+        with self.__lock:
+            self.counts[path] += 1
+
+    def feed(self, id):
+        with self.__lock:
+            if id not in self.__cache:
+                self.__cache[id] = generate_rss(
+                    id, self.episodes, self.padding
+                )
+            return self.__cache[id]
+
+    def mode(self, id):
+        value = random.Random(id).random()
+        for mode, rate in self.rates:
+            if value < rate:
+                return mode
+            value -= rate
+        return None
+
+    def opml(self):
+        outlines = []
+        for id in map(str, range(self.feeds)):
+            kind = 'moved' if self.mode(id) == 'redirect' else 'feed'
+            outlines.append(
+                '<outline type="rss" text="Podcast %s" xmlUrl="%s/%s/%s"/>'
+                % (id, self.url, kind, id)
+            )
+        return (OPML_TEMPLATE % '\n'.join(outlines)).encode('utf-8')
+
+    def handle_error(self, request, client_address):
+        pass  # clients may have timed out and closed their connection
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+
+def get_config(**kwargs):
+    ext = Extension()
+    parser = ConfigParser.RawConfigParser()
+    parser.readfp(io.BytesIO(ext.get_default_config()))
+    raw = dict(parser.items(ext.ext_name))
+    raw.update((k, '' if v is None else str(v)) for k, v in kwargs.items())
+    values, errors = ext.get_config_schema().deserialize(raw)
+    if errors:
+        raise ValueError(errors)
+    return {
+        ext.ext_name: values,
+        'core': {'config_dir': os.getcwd(), 'data_dir': os.getcwd()},
+        'proxy': {}
+    }
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+# issue random browse, lookup and translate_uri calls for all feeds
+# listed in the OPML directory `root` from concurrent client threads;
+# feeds are chosen following Zipf's law with exponent `zipf`, so the
+# default of 0 chooses all feeds with equal probability
+def run(backend, root, clients=10, requests=100, seed=0, zipf=0):
+    library = backend.library
+    playback = backend.playback
+    albums = [ref.uri for ref in library.browse(root).get()
+              if ref.type == models.Ref.ALBUM]
+    weights = []  # cumulative weights
+    for rank in range(1, len(albums) + 1):
+        weights.append((weights[-1] if weights else 0) + 1.0 / rank ** zipf)
+    tracks = collections.defaultdict(list)  # discovered episode URIs
+    feeds = collections.Counter()  # requests per album URI
+    latencies = collections.defaultdict(list)
+    errors = collections.Counter()
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def client(rng):
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            index = bisect.bisect(weights, rng.random() * weights[-1])
+            uri = albums[min(index, len(albums) - 1)]
+            op = rng.choice(['browse', 'lookup', 'translate_uri'])
+            if op == 'translate_uri' and not tracks[uri]:
+                op = 'browse'  # no known episodes yet
+            with lock:
+                feeds[uri] += 1
+            if op != 'browse' and tracks[uri]:
+                uri = rng.choice(tracks[uri])
+            start = timeit.default_timer()
+            try:
+                if op == 'browse':
+                    result = library.browse(uri).get()
+                elif op == 'lookup':
+                    result = library.lookup(uri).get()
+                else:
+                    result = playback.translate_uri(uri).get()
+            except Exception:
+                result = None
+            elapsed = timeit.default_timer() - start
+            with lock:
+                latencies[op].append(elapsed)
+                if not result:
+                    errors[op] += 1
+                elif op == 'browse':
+                    tracks[uri] = [ref.uri for ref in result]
+
+    start = timeit.default_timer()
+    threads = [threading.Thread(target=client, args=(random.Random(seed + i),))
+               for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = timeit.default_timer() - start
+    return {
+        'requests': requests,
+        'elapsed': elapsed,
+        'throughput': requests / elapsed,
+        'errors': dict(errors),
+        'feeds': dict(feeds),
+        'latency': {op: {
+            'count': len(values),
+            'p50': percentile(values, 50),
+            'p90': percentile(values, 90),
+            'p99': percentile(values, 99),
+            'max': max(values)
+        } for op, values in latencies.items()}
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m tests.loadtest',
+        description='Run a load test against a local fake feed server.'
+    )
+    parser.add_argument('-f', '--feeds', type=int, default=50)
+    parser.add_argument('-e', '--episodes', type=int, default=200)
+    parser.add_argument('-p', '--padding', type=int, default=0,
+                        help='extra description bytes per episode')
+    parser.add_argument('-l', '--latency', type=float, default=0.05,
+                        help='server latency in seconds')
+    parser.add_argument('-c', '--clients', type=int, default=10)
+    parser.add_argument('-n', '--requests', type=int, default=1000)
+    parser.add_argument('-z', '--zipf', type=float, default=0,
+                        help='Zipf exponent for choosing feeds')
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--timeout-rate', type=float, default=0)
+    parser.add_argument('--redirect-rate', type=float, default=0)
+    parser.add_argument('-o', '--option', metavar='NAME=VALUE',
+                        action='append', default=[],
+                        help='set extension config value')
+    args = parser.parse_args(argv)
+    logging.getLogger('mopidy_podcast').addHandler(logging.NullHandler())
+
+    options = dict(opt.partition('=')[::2] for opt in args.option)
+    options.setdefault('timeout', '1')
+    config = get_config(**options)
+    server = FeedServer(
+        feeds=args.feeds,
+        episodes=args.episodes,
+        padding=args.padding,
+        latency=args.latency,
+        timeout=config[Extension.ext_name]['timeout'] + 1,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        redirect_rate=args.redirect_rate
+    ).start()
+    actor = backend.PodcastBackend.start(config, None)
+    try:
+        result = run(actor.proxy(), 'podcast+%s/podcasts.opml' % server.url,
+                     clients=args.clients, requests=args.requests,
+                     zipf=args.zipf)
+        cache = actor.proxy().feeds.stats().get()
+    finally:
+        actor.stop()
+        server.shutdown()
+    print('%(requests)d requests in %(elapsed).2f s '
+          '(%(throughput).1f requests/s)' % result)
+    for op, stats in sorted(result['latency'].items()):
+        print('%-14s n=%-6d p50=%.4f p90=%.4f p99=%.4f max=%.4f s' % (
+            op, stats['count'], stats['p50'], stats['p90'], stats['p99'],
+            stats['max']
+        ))
+    print('errors: %s' % (result['errors'] or 'none'))
+    print('fetches: %d requests for %d URLs' % (
+        sum(server.counts.values()), len(server.counts)
+    ))
+    print('cache: policy=%(policy)s size=%(size)d/%(maxsize)d '
+          'hits=%(hits)d misses=%(misses)d' % cache)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+from __future__ import unicode_literals
+
+import os
+import struct
+import urllib
+import zlib
+
+import mock
+
+from mopidy import models
+
+import pytest
+
+from mopidy_podcast import Extension, artwork, backend
+
+
+def png(width, height):
+    def chunk(tag, data):
+        crc = zlib.crc32(tag + data) & 0xffffffff
+        return struct.pack(b'>I', len(data)) + tag + data + struct.pack(
+            b'>I', crc
+        )
+    row = b'\0' + b'\xff\x80\0' * width
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        chunk(b'IHDR', struct.pack(b'>IIBBBBB', width, height, 8, 2, 0, 0, 0)),
+        chunk(b'IDAT', zlib.compress(row * height)),
+        chunk(b'IEND', b'')
+    ])
+
+
+@pytest.fixture
+def image(tmpdir):
+    def image(name, width=200, height=100):
+        path = tmpdir.mkdir(name).join('cover.png')
+        path.write(png(width, height), mode='wb')
+        return models.Image(uri='file:' + urllib.pathname2url(str(path)))
+    return image
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('artwork'))
+
+
+def test_images(image, path):
+    cache = artwork.ArtworkCache(path, maxsize=1000000)
+    remote = image('a')
+    assert cache.images([remote]) == [remote]
+    cache.join()
+    images = cache.images([remote])
+    assert len(images) == 1
+    assert images[0].uri.startswith('/podcast/artwork/')
+    assert images[0].uri.endswith('.png')
+    name = images[0].uri[len(artwork.URI_PREFIX):]
+    with open(os.path.join(path, name), 'rb') as f:
+        assert f.read() == png(200, 100)
+    cache.close()
+    # cached images are loaded on startup
+    cache = artwork.ArtworkCache(path, maxsize=1000000)
+    assert cache.images([remote]) == images
+    cache.close()
+
+
+def test_resized(image, path):
+    pytest.importorskip('PIL')
+    cache = artwork.ArtworkCache(path, maxsize=1000000, sizes=[100, 50, 400])
+    remote = image('a')
+    cache.images([remote])
+    cache.join()
+    images = cache.images([remote])
+    assert [(i.width, i.height) for i in images] == [
+        (50, 25), (100, 50), (200, 100)
+    ]
+    assert images[0].uri.endswith('-50.jpg')
+    assert images[1].uri.endswith('-100.jpg')
+    for i in images:
+        assert os.path.exists(
+            os.path.join(path, i.uri[len(artwork.URI_PREFIX):])
+        )
+    cache.close()
+
+
+def test_evict(image, path):
+    size = len(png(200, 100))
+    cache = artwork.ArtworkCache(path, maxsize=size * 2)
+    a, b, c = image('a'), image('b'), image('c')
+    for remote in (a, b, a, c):
+        cache.images([remote])
+        cache.join()
+    # b is least recently used
+    assert cache.images([a]) != [a]
+    assert cache.images([b]) == [b]
+    assert cache.images([c]) != [c]
+    assert len(os.listdir(path)) == 4
+    cache.close()
+
+
+def test_error(image, path):
+    opener = Extension.get_url_opener({'proxy': {}})
+    with mock.patch.object(opener, 'open', wraps=opener.open) as mock_open:
+        cache = artwork.ArtworkCache(path, maxsize=10, opener=opener)
+        missing = models.Image(uri='file:///does/not/exist.png')
+        toolarge = image('a')
+        for remote in (missing, toolarge):
+            assert cache.images([remote]) == [remote]
+            cache.join()
+            assert cache.images([remote]) == [remote]
+            cache.join()
+        # failed images are not retried
+        assert mock_open.call_count == 2
+        cache.close()
+    assert os.listdir(path) == []
+
+
+def test_factory(config, path):
+    assert artwork.factory(config, None) == []
+    config['podcast']['artwork_dir'] = path
+    [(pattern, handler, kwargs)] = artwork.factory(config, None)
+    assert kwargs == {'path': path}
+
+
+def test_get_images(config, audio, image, path):
+    config['podcast']['artwork_dir'] = path
+    b = backend.PodcastBackend(config, audio)
+    remote = image('a')
+    feed = mock.Mock()
+    feed.images.return_value = [('podcast+file:///feed.xml', [remote])]
+    with mock.patch.object(backend.PodcastFeedCache, '__getitem__',
+                           return_value=feed):
+        uri = 'podcast+file:///feed.xml'
+        assert b.library.get_images([uri]) == {uri: [remote]}
+        b.artwork.join()
+        [image] = b.library.get_images([uri])[uri]
+        assert image.uri.startswith(artwork.URI_PREFIX)
+    b.on_stop()
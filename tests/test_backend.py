@@ -0,0 +1,216 @@
+from __future__ import unicode_literals
+
+import multiprocessing
+import os
+import subprocess
+import sys
+
+import mock
+
+import pytest
+
+from mopidy_podcast import backend, feeds, stores
+
+from . import loadtest
+
+
+@pytest.mark.parametrize('filename', ['directory.xml', 'rssfeed.xml'])
+def test_parse_workers(config, audio, filename, abspath):
+    config['podcast']['parse_workers'] = 1
+    config['podcast']['parse_threshold'] = 0
+    feed = feeds.parse(abspath(filename))
+    cache = backend.PodcastBackend(config, audio).feeds
+    try:
+        assert list(cache[feed.uri].items()) == list(feed.items())
+    finally:
+        cache.close()
+
+
+def test_lazy_imports():
+    modules = subprocess.check_output([sys.executable, '-c', (
+        'import sys, mopidy_podcast.backend; print("\\n".join(sys.modules))'
+    )], cwd=os.path.dirname(os.path.dirname(backend.__file__))).splitlines()
+    for name in ['cachetools', 'uritools', 'mopidy_podcast.feeds']:
+        assert name not in modules
+    assert not any(name.startswith(('xml.', 'lxml')) for name in modules)
+
+
+@pytest.mark.parametrize('engine', ['ElementTree', 'cElementTree'])
+def test_xml_engine(config, audio, engine, abspath):
+    config['podcast']['xml_engine'] = engine
+    feed = feeds.parse(abspath('rssfeed.xml'))
+    cache = backend.PodcastBackend(config, audio).feeds
+    with mock.patch.object(feeds, 'parse', wraps=feeds.parse) as parse:
+        try:
+            assert list(cache[feed.uri].tracks()) == list(feed.tracks())
+        finally:
+            cache.close()
+    assert parse.call_args[1] == {'engine': engine}
+
+
+def test_parse_timeout(config, abspath):
+    config['podcast']['parse_workers'] = 1
+    config['podcast']['parse_threshold'] = 0
+    feed = feeds.parse(abspath('rssfeed.xml'))
+    cache = backend.PodcastFeedCache(config)
+    try:
+        with mock.patch('multiprocessing.pool.ApplyResult.get') as get:
+            get.side_effect = multiprocessing.TimeoutError
+            assert list(cache[feed.uri].items()) == list(feed.items())
+            get.assert_called_once_with(cache.PARSE_TIMEOUT)
+    finally:
+        cache.close()
+
+
+@pytest.mark.parametrize('headers,expected', [
+    ({}, None),
+    ({'Cache-Control': 'public, max-age=300'}, 300),
+    ({'Cache-Control': 'max-age="600"', 'Expires': '0'}, 600),
+    ({'Expires': 'Thu, 01 Dec 1994 16:00:00 GMT',
+      'Date': 'Thu, 01 Dec 1994 15:00:00 GMT'}, 3600),
+    ({'Expires': 'Thu, 01 Dec 1994 16:00:00 GMT'}, 0),
+    ({'Expires': '0'}, None),
+])
+def test_get_max_age(headers, expected):
+    assert backend.get_max_age(headers, now=1e9) == expected
+
+
+@pytest.mark.parametrize('uri,expected', [
+    ('podcast+file:///feed.xml#foo', 'podcast+file:///feed.xml'),
+    ('podcast+http://example.com/feed.xml', None),
+    ('podcast+HTTPS://Example.COM:443/feed.xml', None),
+    ('podcast+http://example.com:80/feed.xml/', None),
+    ('podcast+http://example.com/feed.xml?utm_source=opml#foo', None),
+    ('podcast+http://example.com:8080/feed.xml',
+     'podcast+http://example.com:8080/feed.xml'),
+    ('podcast+http://example.com/?b=2&utm_medium=x&a=1',
+     'podcast+http://example.com/?a=1&b=2'),
+])
+def test_canonicalize(uri, expected):
+    expected = expected or 'podcast+http://example.com/feed.xml'
+    assert backend.canonicalize(uri, ['utm_*']) == expected
+
+
+def test_canonical_uris(config, abspath):
+    server = loadtest.FeedServer(feeds=1, redirect_rate=1).start()
+    try:
+        cache = backend.PodcastFeedCache(config)
+        moved = cache['podcast+%s/moved/0' % server.url]
+        assert cache['podcast+%s/feed/0' % server.url] is moved
+        assert cache['podcast+%s/feed/0/?utm_source=x' % server.url] is moved
+        assert cache['podcast+%s/moved/0' % server.url] is moved
+        assert server.counts == {'/moved/0': 1, '/feed/0': 1}
+    finally:
+        server.shutdown()
+
+
+@pytest.mark.parametrize('ttl', [1, 3600, 86400])
+def test_cache_ttl(config, audio, abspath, ttl):
+    config['podcast']['cache_ttl'] = ttl
+    timer = mock.Mock(return_value=1000)
+    cache = backend.PodcastFeedCache(config, timer=timer)
+    uri = feeds.parse(abspath('directory.xml')).uri
+    feed = cache[uri]
+    timer.return_value = 1000 + ttl - 1
+    assert uri in cache
+    assert cache[uri] is feed
+    timer.return_value = 1000 + ttl + 1
+    assert uri in cache  # stale
+    assert cache[uri] is feed
+    cache.join()
+    assert cache[uri] is not feed
+
+
+def test_refresh_error(config, abspath, tmpdir):
+    path = tmpdir.join('rssfeed.xml')
+    path.write(open(abspath('rssfeed.xml')).read())
+    timer = mock.Mock(return_value=1000)
+    cache = backend.PodcastFeedCache(config, timer=timer)
+    uri = feeds.parse(str(path)).uri
+    feed = cache[uri]
+    path.remove()
+    cache.expire(uri)
+    assert cache[uri] is feed
+    cache.join()
+    assert cache[uri] is feed
+    timer.return_value += config['podcast']['cache_ttl_min'] - 1
+    assert uri in cache
+    assert cache[uri] is feed
+
+
+@pytest.mark.parametrize('filename', ['directory.xml', 'rssfeed.xml'])
+def test_shared_cache(config, abspath, filename, tmpdir):
+    config['podcast']['shared_cache_dir'] = str(tmpdir)
+    feed = feeds.parse(abspath(filename))
+    cache1 = backend.PodcastFeedCache(config)
+    cache2 = backend.PodcastFeedCache(config)
+    assert list(cache1[feed.uri].items()) == list(feed.items())
+    with mock.patch.object(feeds, 'parse') as parse:
+        assert list(cache2[feed.uri].items()) == list(feed.items())
+        assert not parse.called
+    assert feed.uri in cache2
+    cache2.clear()
+    assert feed.uri in cache1  # still in local memory store
+    assert feed.uri not in cache2
+
+
+def test_shared_cache_expire(config, abspath, tmpdir):
+    config['podcast']['shared_cache_dir'] = str(tmpdir)
+    uri = feeds.parse(abspath('rssfeed.xml')).uri
+    cache1 = backend.PodcastFeedCache(config)
+    cache2 = backend.PodcastFeedCache(config)
+    feed = cache1[uri]
+    cache2[uri]
+    with mock.patch.object(stores.FileStore, 'set') as set:
+        cache1.expire()
+        assert not set.called
+    with mock.patch.object(feeds, 'parse') as parse:
+        cache2[uri]
+        assert not parse.called  # still fresh for other instances
+    with mock.patch.object(feeds, 'parse') as parse:
+        parse.return_value = feeds.parse(abspath('rssfeed.xml'))
+        assert cache1[uri] is feed  # stale, refreshing in the background
+        cache1.join()
+        assert parse.called
+    assert cache1[uri] is not feed
+
+
+@pytest.mark.parametrize('filename', ['rssfeed.xml'])
+def test_cache_warmup(config, audio, abspath, filename, tmpdir):
+    config['core']['data_dir'] = str(tmpdir)
+    config['podcast']['cache_warmup'] = 1
+    uri = feeds.parse(abspath(filename)).uri
+    b = backend.PodcastBackend(config, audio)
+    b.feeds[uri]
+    b.on_stop()
+    b = backend.PodcastBackend(config, audio)
+    assert uri not in b.feeds
+    b.warm_up()
+    assert uri in b.feeds
+    b.on_stop()
+
+
+@pytest.mark.parametrize('recent', ['{}', '[1, 2, 3]', 'null', '[['])
+def test_cache_warmup_error(config, audio, abspath, tmpdir, recent, caplog):
+    config['core']['data_dir'] = str(tmpdir)
+    config['podcast']['browse_root'] = abspath('directory.xml')
+    config['podcast']['cache_warmup'] = 1
+    tmpdir.join('podcast', backend.RECENT_FEEDS_FILE).write(
+        recent, ensure=True
+    )
+    b = backend.PodcastBackend(config, audio)
+    b.on_start()
+    b.on_stop()  # waits for warm-up to finish
+    assert 'Error loading recently used podcast feeds' in caplog.text
+
+
+def test_refresh_threads(config, abspath):
+    timer = mock.Mock(return_value=1000)
+    cache = backend.PodcastFeedCache(config, timer=timer)
+    uri = feeds.parse(abspath('rssfeed.xml')).uri
+    cache[uri]
+    cache.expire()
+    with mock.patch('threading.Thread.start') as start:
+        for _ in range(10):
+            cache[uri]
+        assert start.call_count == cache.REFRESH_THREADS
@@ -0,0 +1,83 @@
+from __future__ import unicode_literals
+
+import calendar
+import time
+
+import pytest
+
+from mopidy_podcast import episodes, feeds
+
+
+@pytest.fixture
+def feed(abspath):
+    return feeds.parse(abspath('rssfeed.xml'))
+
+
+@pytest.fixture
+def store(tmpdir, feed):
+    store = episodes.EpisodeStore(str(tmpdir.join('episodes.db')))
+    store.update(feed, expires=1000)
+    yield store
+    store.close()
+
+
+def test_items(store, feed):
+    assert store.items(feed.uri, False, 0) == list(feed.items(False))
+    assert store.items(feed.uri, True, 0) == list(feed.items(True))
+    assert store.items(feed.uri, True, 1000) is None
+    assert store.items('podcast+file:///', True, 0) is None
+
+
+def test_tracks(store, feed):
+    assert store.tracks(feed.uri, False, 0) == list(feed.tracks(False))
+    assert store.tracks(feed.uri, True, 0) == list(feed.tracks(True))
+    for newest_first in (False, True):
+        assert store.tracks(feed.uri, newest_first, 0, limit=1) == list(
+            feed.tracks(newest_first, limit=1)
+        )
+        tracks = list(feed.tracks(True))
+        since = calendar.timegm(time.strptime(tracks[1].date, '%Y-%m-%d'))
+        assert store.tracks(feed.uri, newest_first, 0, since=since) == list(
+            feed.tracks(newest_first, since=since)
+        )
+    for track in feed.tracks():
+        assert store.track(track.uri) == track
+        assert store.track(track.uri, 0) == track
+        assert store.track(track.uri, 1000) is None
+    assert store.track(feed.uri + '#n/a') is None
+
+
+def test_streamuri(store, feed):
+    for uri, streamuri in feed.streams():
+        assert store.streamuri(uri) == streamuri
+
+
+def test_stream_index(tmpdir, feed):
+    index = episodes.StreamIndex(str(tmpdir.join('streams.db')))
+    index.update(feed)
+    index.update(feed)
+    for uri, streamuri in feed.streams():
+        assert index.streamuri(uri) == streamuri
+    assert index.streamuri(feed.uri + '#n/a') is None
+    index.close()
+
+
+def test_query(store, feed):
+    tracks = list(feed.tracks(newest_first=True))
+    assert store.query() == tracks
+    assert store.query(feed=feed.uri, limit=1) == tracks[:1]
+    assert store.query(author='John Doe') == [
+        t for t in tracks if [a.name for a in t.artists] == ['John Doe']
+    ]
+    assert store.query(since=tracks[1].date) == tracks[:2]
+    assert store.query(until=tracks[1].date) == tracks[1:]
+    assert store.query(guid='n/a') == []
+
+
+def test_expire(store, feed):
+    store.expire(feed.uri)
+    assert store.items(feed.uri, False, 0) is None
+    assert store.track(next(feed.tracks()).uri, 0) is None
+    store.update(feed, expires=1000)
+    store.expire()
+    assert store.tracks(feed.uri, False, 0) is None
@@ -6,7 +6,7 @@ import mock
 
 import pytest
 
-from mopidy_podcast import Extension, backend
+from mopidy_podcast import Extension, artwork, backend
 
 
 def test_get_default_config():
@@ -20,15 +20,44 @@ def test_get_config_schema():
     assert 'browse_root' in schema
     assert 'browse_order' in schema
     assert 'lookup_order' in schema
+    assert 'lookup_limit' in schema
+    assert 'lookup_max_age' in schema
+    assert 'latest_episodes' in schema
     assert 'cache_size' in schema
+    assert 'cache_policy' in schema
     assert 'cache_ttl' in schema
+    assert 'cache_ttl_min' in schema
+    assert 'cache_ttl_max' in schema
+    assert 'cache_warmup' in schema
+    assert 'shared_cache_dir' in schema
+    assert 'canonical_uris' in schema
+    assert 'ignore_query_params' in schema
+    assert 'artwork_dir' in schema
+    assert 'artwork_cache_size' in schema
+    assert 'artwork_sizes' in schema
     assert 'timeout' in schema
+    assert 'episode_store' in schema
+    assert 'stream_index' in schema
+    assert 'profile_threshold' in schema
+    assert 'profile_sample' in schema
+    assert 'profile_dir' in schema
+    assert 'profile_count' in schema
+    assert 'parse_workers' in schema
+    assert 'parse_threshold' in schema
+    assert 'xml_engine' in schema
 
 
 def test_setup():
     registry = mock.Mock()
     Extension().setup(registry)
-    registry.add.assert_called_once_with('backend', backend.PodcastBackend)
+    registry.add.assert_has_calls([
+        mock.call('backend', backend.PodcastBackend),
+        mock.call('http:app', {
+            'name': Extension.ext_name,
+            'factory': artwork.factory
+        })
+    ])
+    assert registry.add.call_count == 2
 
 
 @pytest.mark.parametrize('url,handler,method,proxy_config', [
@@ -1,5 +1,7 @@
 from __future__ import unicode_literals
 
+import pickle
+
 import pytest
 
 import uritools
@@ -17,3 +19,33 @@ def test_parse(abspath, filename, expected):
     feed = feeds.parse(path)
     assert isinstance(feed, expected)
     assert feed.uri == uritools.uricompose('podcast+file', '', path)
+
+
+@pytest.mark.parametrize('filename', ['directory.xml', 'rssfeed.xml'])
+def test_pickle(abspath, filename):
+    feed = feeds.parse(abspath(filename))
+    copy = pickle.loads(pickle.dumps(feed, pickle.HIGHEST_PROTOCOL))
+    assert copy.uri == feed.uri
+    assert list(copy.items()) == list(feed.items())
+    assert list(copy.tracks()) == list(feed.tracks())
+    assert dict(copy.images()) == dict(feed.images())
+
+
+@pytest.mark.parametrize('engine', list(feeds.XML_ENGINES))
+@pytest.mark.parametrize('filename', ['directory.xml', 'rssfeed.xml'])
+def test_engine(abspath, filename, engine):
+    pytest.importorskip(feeds.XML_ENGINES[engine])
+    feed = feeds.parse(abspath(filename))
+    copy = feeds.parse(abspath(filename), engine=engine)
+    assert type(copy) is type(feed)
+    assert copy.uri == feed.uri
+    assert copy.ttl(0) == feed.ttl(0)
+    assert list(copy.items()) == list(feed.items())
+    assert list(copy.tracks()) == list(feed.tracks())
+    assert dict(copy.images()) == dict(feed.images())
+    assert list(copy.streams()) == list(feed.streams())
+
+
+def test_unknown_engine(abspath):
+    with pytest.raises(ValueError):
+        feeds.parse(abspath('rssfeed.xml'), engine='unknown')
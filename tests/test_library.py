@@ -1,8 +1,10 @@
 from __future__ import unicode_literals
 
+import mock
+
 import pytest
 
-from mopidy_podcast import feeds
+from mopidy_podcast import backend, feeds
 
 
 def test_root_directory(library):
@@ -19,6 +21,18 @@ def test_browse(config, library, filename, abspath):
     assert feed.uri in library.backend.feeds
 
 
+@pytest.mark.parametrize('filename', ['rssfeed.xml'])
+def test_lookup_limit(config, audio, filename, abspath):
+    feed = feeds.parse(abspath(filename))
+    config['podcast']['lookup_limit'] = 2
+    library = backend.PodcastBackend(config, audio).library
+    tracks = list(feed.tracks(newest_first=True))
+    assert library.lookup(feed.uri) == list(reversed(tracks[:2]))
+    config['podcast']['lookup_max_age'] = 1
+    library = backend.PodcastBackend(config, audio).library
+    assert library.lookup(feed.uri) == []
+
+
 @pytest.mark.parametrize('uri,expected', [
     (None, []),
     ('podcast+file:///', []),
@@ -79,10 +93,92 @@ def test_lookup_error(library, uri, expected):
 def test_refresh(library, filename, abspath):
     feed = feeds.parse(abspath(filename))
     tracks = library.lookup(feed.uri)
-    assert feed.uri in library.backend.feeds
+    cached = library.backend.feeds[feed.uri]
     library.refresh(tracks[0].uri)
-    assert feed.uri not in library.backend.feeds
-    library.lookup(tracks[0].uri)
+    assert feed.uri in library.backend.feeds  # stale
+    assert library.lookup(feed.uri) == tracks
+    library.backend.feeds.join()
+    assert library.backend.feeds[feed.uri] is not cached
+    library.refresh()
+    assert feed.uri in library.backend.feeds
+    assert library.lookup(feed.uri) == tracks
+
+
+@pytest.mark.parametrize('filename', ['rssfeed.xml'])
+def test_episode_store(config, audio, filename, abspath, tmpdir):
+    config['podcast']['episode_store'] = str(tmpdir.join('episodes.db'))
+    feed = feeds.parse(abspath(filename))
+    library = backend.PodcastBackend(config, audio).library
+    tracks = library.lookup(feed.uri)
+    library.backend.feeds.clear()
+    with mock.patch.object(feeds, 'parse') as parse:
+        assert library.lookup(feed.uri) == tracks
+        assert library.lookup(tracks[0].uri) == tracks[:1]
+        newest_first = config['podcast']['browse_order'] == 'desc'
+        assert library.browse(feed.uri) == list(feed.items(newest_first))
+        assert not parse.called
+    library.refresh()
+    assert library.lookup(feed.uri) == tracks
     assert feed.uri in library.backend.feeds
+
+
+def test_episode_store_directory(config, audio, abspath, tmpdir):
+    config['podcast']['episode_store'] = str(tmpdir.join('episodes.db'))
+    config['podcast']['browse_root'] = abspath('directory.xml')
+    library = backend.PodcastBackend(config, audio).library
+    refs = library.browse(library.root_directory.uri)
+    assert refs
+    library.backend.feeds.clear()
+    assert library.browse(library.root_directory.uri) == refs
+
+
+def test_latest_episodes(config, audio, abspath, tmpdir):
+    rss = open(abspath('rssfeed.xml')).read()
+    # second feed with episodes published one hour after the first's
+    tmpdir.join('rssfeed.xml').write(rss.replace('19:00:00', '20:00:00'))
+    tmpdir.join('Podcasts.opml').write(
+        '<opml><body>'
+        '<outline type="rss" text="1" xmlUrl="file://%s"/>'
+        '<outline type="rss" text="2" xmlUrl="file://%s"/>'
+        '</body></opml>' % (abspath('rssfeed.xml'), tmpdir.join('rssfeed.xml'))
+    )
+    config['podcast']['browse_root'] = str(tmpdir.join('Podcasts.opml'))
+    config['podcast']['latest_episodes'] = 3
+    library = backend.PodcastBackend(config, audio).library
+    refs = library.browse(library.root_directory.uri)
+    assert refs[0].uri == 'podcast:latest'
+    assert len(refs) == 3
+    feed1 = feeds.parse(abspath('rssfeed.xml'))
+    feed2 = feeds.parse(str(tmpdir.join('rssfeed.xml')))
+    items1 = list(feed1.items(newest_first=True))
+    items2 = list(feed2.items(newest_first=True))
+    latest = library.browse('podcast:latest')
+    assert latest == [items2[0], items1[0], items2[1]]
+    assert library.browse('podcast:latest') == latest
     library.refresh()
-    assert not library.backend.feeds
+    assert library.browse('podcast:latest') == latest
+    tracks = library.lookup('podcast:latest')
+    assert [t.uri for t in tracks] == [ref.uri for ref in latest]
+    assert library.get_images(['podcast:latest']) == {}
+
+
+def test_latest_episodes_uncached(config, audio, abspath, tmpdir):
+    rss = open(abspath('rssfeed.xml')).read()
+    outlines = []
+    for i in range(3):
+        path = tmpdir.join('rssfeed%d.xml' % i)
+        path.write(rss)
+        outlines.append('<outline type="rss" xmlUrl="file://%s"/>' % path)
+    tmpdir.join('Podcasts.opml').write(
+        '<opml><body>%s</body></opml>' % ''.join(outlines)
+    )
+    config['podcast']['browse_root'] = str(tmpdir.join('Podcasts.opml'))
+    config['podcast']['latest_episodes'] = 3
+    config['podcast']['cache_size'] = 2
+    library = backend.PodcastBackend(config, audio).library
+    latest = library.browse('podcast:latest')
+    assert len(latest) == 3
+    # feeds evicted from the cache should not be retrieved again
+    with mock.patch.object(feeds, 'parse', wraps=feeds.parse) as parse:
+        assert library.browse('podcast:latest') == latest
+        assert parse.call_count <= 1  # browse root only
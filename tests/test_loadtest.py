@@ -0,0 +1,52 @@
+from __future__ import unicode_literals
+
+import pytest
+
+from mopidy_podcast import backend
+
+from . import loadtest
+
+
+@pytest.fixture
+def server():
+    server = loadtest.FeedServer(
+        feeds=10, episodes=20, latency=0.01, timeout=0.5,
+        error_rate=0.2, timeout_rate=0.1, redirect_rate=0.3
+    ).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def actor(tmpdir):
+    config = loadtest.get_config()
+    config['core']['data_dir'] = str(tmpdir)
+    config['podcast']['timeout'] = 0.1  # shorter than server timeout
+    actor = backend.PodcastBackend.start(config, None)
+    yield actor
+    actor.stop()
+
+
+def test_loadtest(server, actor):
+    root = 'podcast+%s/podcasts.opml' % server.url
+    result = loadtest.run(actor.proxy(), root, clients=5, requests=200)
+    assert result['requests'] == 200
+    assert sum(s['count'] for s in result['latency'].values()) == 200
+    assert sum(result['feeds'].values()) == 200
+    # feeds requested by clients should be fetched exactly once
+    for id in map(str, range(server.feeds)):
+        mode = server.mode(id)
+        if mode == 'redirect':
+            path = '/moved/' + id
+        else:
+            path = '/feed/' + id
+        uri = 'podcast+%s%s' % (server.url, path)
+        if mode in ('error', 'timeout'):
+            assert server.counts[path] == result['feeds'].get(uri, 0)
+        elif uri in result['feeds']:
+            assert server.counts[path] == 1
+            assert server.counts['/feed/' + id] == 1  # not refetched
+        else:
+            assert server.counts[path] == 0
+    assert server.counts['/podcasts.opml'] == 1
+    assert result['errors']
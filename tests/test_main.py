@@ -0,0 +1,67 @@
+from __future__ import unicode_literals
+
+import json
+
+import pytest
+
+from mopidy_podcast import __main__ as main, feeds
+
+
+@pytest.mark.parametrize('filename,type,episodes', [
+    ('directory.xml', 'OpmlFeed', 0),
+    ('rssfeed.xml', 'RssFeed', 3)
+])
+def test_load(abspath, filename, type, episodes):
+    feed = feeds.parse(abspath(filename))
+    stats = main.load(main.geturl(abspath(filename)))
+    assert 'error' not in stats
+    assert stats['uri'] == feed.uri
+    assert stats['type'] == type
+    assert stats['episodes'] == episodes
+    assert stats['size'] > 0
+    assert stats['fetch_time'] >= 0
+    assert stats['parse_time'] >= 0
+    assert len(stats['items']) == len(list(feed.items()))
+
+
+def test_load_error(abspath):
+    stats = main.load(main.geturl(abspath('nonexistent.xml')))
+    assert 'error' in stats
+
+
+def test_main(abspath, capsys):
+    sources = [abspath('rssfeed.xml'), abspath('nonexistent.xml')]
+    assert main.main(['-j', '1', '-f', 'ndjson', '-s'] + sources) == 1
+    out, _ = capsys.readouterr()
+    stats = [json.loads(line) for line in out.splitlines()]
+    assert [s['url'] for s in stats] == [main.geturl(s) for s in sources]
+    assert stats[0]['episodes'] == 3
+    assert 'items' not in stats[0]
+    assert 'error' in stats[1]
+
+
+def test_main_engine(abspath, capsys):
+    sources = [abspath('rssfeed.xml')]
+    assert main.main(['-j', '1', '-s', '-e', 'ElementTree'] + sources) == 0
+    out, _ = capsys.readouterr()
+    stats = json.loads(out)
+    assert stats[0]['engine'] == 'ElementTree'
+    assert stats[0]['episodes'] == 3
+
+
+@pytest.mark.parametrize('format', ['json', 'ndjson'])
+def test_main_opml_error(abspath, capsys, tmpdir, format):
+    opml = tmpdir.join('podcasts.opml')
+    opml.write('<opml><body><outline type="rss" xmlUrl="%s"/></body></opml>'
+               % main.geturl(abspath('rssfeed.xml')))
+    sources = [str(opml), abspath('nonexistent.xml')]
+    assert main.main(['-j', '1', '-f', format, '-s', '-O'] + sources) == 1
+    out, _ = capsys.readouterr()
+    if format == 'json':
+        stats = json.loads(out)
+    else:
+        stats = [json.loads(line) for line in out.splitlines()]
+    assert len(stats) == 2
+    assert stats[0]['url'] == main.geturl(sources[1])
+    assert 'error' in stats[0]
+    assert stats[1]['episodes'] == 3
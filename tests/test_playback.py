@@ -1,8 +1,10 @@
 from __future__ import unicode_literals
 
+import mock
+
 import pytest
 
-from mopidy_podcast import feeds
+from mopidy_podcast import backend, feeds
 
 
 @pytest.mark.parametrize('filename', ['rssfeed.xml'])
@@ -16,3 +18,20 @@ def test_translate_uri(playback, filename, abspath):
 
 def test_translate_empty_uri(playback):
     assert playback.translate_uri('') is None
+
+
+@pytest.mark.parametrize('filename', ['rssfeed.xml'])
+def test_translate_indexed_uri(config, audio, tmpdir, filename, abspath):
+    config['podcast']['stream_index'] = str(tmpdir.join('streams.db'))
+    b = backend.PodcastBackend(config, audio)
+    feed = feeds.parse(abspath(filename))
+    b.library.lookup(feed.uri)
+    b.feeds.clear()
+    with mock.patch.object(backend.PodcastFeedCache, '__getitem__',
+                           side_effect=Exception('not cached')) as getitem:
+        for uri, url in feed.streams():
+            assert b.playback.translate_uri(uri) == url
+        assert getitem.call_count == 0
+        assert b.playback.translate_uri(feed.uri + '#n/a') is None
+        assert getitem.call_count == 1
+    b.on_stop()
@@ -0,0 +1,36 @@
+from __future__ import unicode_literals
+
+import pstats
+
+import pytest
+
+from mopidy_podcast import backend, feeds
+
+
+@pytest.mark.parametrize('filename', ['rssfeed.xml'])
+def test_profiling(config, audio, abspath, filename, tmpdir):
+    config['core']['data_dir'] = str(tmpdir)
+    config['podcast']['profile_threshold'] = 0
+    config['podcast']['profile_count'] = 2
+    feed = feeds.parse(abspath(filename))
+    b = backend.PodcastBackend(config, audio)
+    assert b.library.browse(feed.uri) == list(feed.items(True))
+    assert b.library.lookup(feed.uri) == list(feed.tracks())
+    track = next(feed.tracks())
+    assert b.playback.translate_uri(track.uri) is not None
+    files = tmpdir.join('podcast', 'profiles').listdir(sort=True)
+    assert len(files) == 2
+    assert '-lookup-' in files[0].basename
+    assert '-translate_uri-' in files[1].basename
+    for f in files:
+        assert pstats.Stats(str(f)).total_calls > 0
+
+
+@pytest.mark.parametrize('filename', ['rssfeed.xml'])
+def test_profiling_threshold(config, audio, abspath, filename, tmpdir):
+    config['core']['data_dir'] = str(tmpdir)
+    config['podcast']['profile_threshold'] = 60000
+    feed = feeds.parse(abspath(filename))
+    b = backend.PodcastBackend(config, audio)
+    assert b.library.browse(feed.uri) == list(feed.items(True))
+    assert not tmpdir.join('podcast', 'profiles').listdir()
@@ -1,5 +1,7 @@
 from __future__ import unicode_literals
 
+import calendar
+
 from mopidy import models
 
 import pytest
@@ -121,6 +123,21 @@ def test_tracks(rss, tracks):
     assert list(rss.tracks(newest_first=False)) == list(reversed(tracks))
 
 
+@pytest.mark.parametrize('limit,since,count', [
+    (None, None, 3),
+    (2, None, 2),
+    (5, None, 3),
+    (None, calendar.timegm((2014, 6, 5, 0, 0, 0)), 2),
+    (1, calendar.timegm((2014, 6, 5, 0, 0, 0)), 1),
+    (None, calendar.timegm((2015, 1, 1, 0, 0, 0)), 0)
+])
+def test_tracks_window(rss, tracks, limit, since, count):
+    newest = list(rss.tracks(True, limit=limit, since=since))
+    assert newest == tracks[:count]
+    oldest = list(rss.tracks(False, limit=limit, since=since))
+    assert oldest == list(reversed(tracks[:count]))
+
+
 def test_images(rss):
     assert dict(rss.images()) == {
         'podcast+http://www.example.com/everything.xml': [
@@ -137,3 +154,25 @@ def test_images(rss):
             models.Image(uri='http://example.com/everything/Podcast.jpg')
         ]
     }
+
+
+@pytest.mark.parametrize('elements,expected', [
+    ('<ttl>60</ttl>', 3600),
+    ('<ttl>x</ttl>', 86400 * 7 // 2),
+    ('<sy:updatePeriod>hourly</sy:updatePeriod>', 3600),
+    ('<sy:updateFrequency>2</sy:updateFrequency>', 43200),
+    ('<sy:updatePeriod>weekly</sy:updatePeriod>'
+     '<sy:updateFrequency>7</sy:updateFrequency>', 86400),
+    ('', 86400 * 7 // 2),
+])
+def test_ttl(elements, expected):
+    from StringIO import StringIO
+
+    xml = XML.replace(
+        b'<channel>',
+        b'<channel xmlns:sy="http://purl.org/rss/1.0/modules/syndication/">'
+        + elements.encode('utf-8')
+    )
+    feed = feeds.parse(StringIO(xml), 'http://www.example.com/everything.xml')
+    # last episode published 2014-06-15, one week after the previous one
+    assert feed.ttl(now=1402858800) == expected
@@ -0,0 +1,102 @@
+from __future__ import unicode_literals
+
+import os
+
+import mock
+
+import pytest
+
+from mopidy_podcast import stores
+
+
+@pytest.fixture
+def entry():
+    return stores.FeedEntry(feed=['feed'], expires=1000)
+
+
+@pytest.mark.parametrize('maxsize', [1, 2])
+def test_memory_store(entry, maxsize):
+    store = stores.MemoryStore(maxsize)
+    store.set('a', entry)
+    store.set('b', entry)
+    assert store.get('a') == (entry if maxsize > 1 else None)
+    assert store.get('b') == entry
+    store.delete('b')
+    assert store.get('b') is None
+
+
+def test_file_store(entry, tmpdir):
+    store = stores.FileStore(str(tmpdir))
+    assert store.get('a') is None
+    store.set('a', entry)
+    store.set('b', entry._replace(expires=2000))
+    assert store.get('a') == entry
+    assert sorted(store.keys()) == ['a', 'b']
+    with mock.patch.object(stores.pickle, 'load') as load:
+        load.return_value = ('a', 1000)
+        assert store.keys() == ['a', 'a']
+        assert load.call_count == 2  # only headers are read
+    store.delete('a')
+    assert store.get('a') is None
+    store.clear()
+    assert store.keys() == []
+
+
+def test_file_store_sweep(entry, tmpdir):
+    path = str(tmpdir)
+    store = stores.FileStore(path)
+    store.set('a', entry)
+    store.set('b', entry._replace(expires=900))
+    with store.lock('a'):
+        pass
+    with store.lock('b'):
+        store.sweep(before=950)
+        # lock files in use must not be removed
+        assert len([n for n in os.listdir(path) if n.endswith('.lock')]) == 1
+    assert store.keys() == ['a']
+    with store.lock('b'):
+        store.set('b', entry._replace(expires=900))
+    store = stores.FileStore(path, maxage=100, timer=lambda: 1050)
+    store.set('c', entry)  # sweeps on first update
+    assert sorted(store.keys()) == ['a', 'c']
+    assert all(name.endswith('.pickle') for name in os.listdir(path))
+
+
+@pytest.mark.parametrize('policy,expected', [
+    ('lru', 0),
+    ('arc', 40),
+    ('tinylfu', 40),
+])
+def test_scan_resistance(entry, policy, expected):
+    store = stores.MemoryStore(10, policy=policy)
+    hits = 0
+    for n in range(10):
+        # hot keys used twice, followed by a scan larger than the cache
+        for key in ['hot%d' % i for i in range(5)]:
+            if store.get(key) is None:
+                store.set(key, entry)
+            elif n:
+                hits += 1
+            assert store.get(key) == entry
+        for key in ['scan%d.%d' % (n, i) for i in range(20)]:
+            if store.get(key) is None:
+                store.set(key, entry)
+    assert hits >= expected
+    stats = store.stats()
+    assert stats['policy'] == policy
+    assert stats['size'] <= stats['maxsize'] == 10
+    assert stats['hits'] + stats['misses'] == 10 * 30
+
+
+@pytest.mark.parametrize('policy', ['lru', 'arc', 'tinylfu'])
+def test_memory_store_policy(entry, policy):
+    store = stores.MemoryStore(3, policy=policy)
+    for key in 'abcdefabcabcdef':
+        store.get(key)
+        store.set(key, entry)
+        assert len(store.keys()) <= 3
+        assert store.get(key) == entry
+    store.delete('f')
+    assert 'f' not in store.keys()
+    store.clear()
+    assert store.keys() == []